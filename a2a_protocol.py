@@ -3,16 +3,61 @@ Agent-to-Agent (A2A) Communication Protocol
 Implements JSON-RPC 2.0 for inter-agent messaging
 """
 
+import atexit
+import itertools
 import json
-import uuid
-from typing import Any, Dict, Optional
+import logging
+import os
+import sys
+import time
+from collections import deque
+from typing import Any, Dict, Mapping, Optional, Union
 from datetime import datetime
 
+def _default(obj: Any) -> Any:
+    """Serialize read-only mappings (e.g. frozen agent cards) as objects"""
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# Prefer orjson (C-implemented) for serialization, fall back to stdlib json
+try:
+    import orjson
+
+    def _dumps(obj: Any, pretty: bool = False) -> str:
+        return orjson.dumps(
+            obj, default=_default, option=orjson.OPT_INDENT_2 if pretty else None
+        ).decode()
+
+    def _dumps_bytes(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default)
+
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj: Any, pretty: bool = False) -> str:
+        if pretty:
+            return json.dumps(obj, indent=2, default=_default)
+        return json.dumps(obj, separators=(",", ":"), default=_default)
+
+    def _dumps_bytes(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), default=_default).encode()
+
+    _loads = json.loads
+
+# Cheap process-unique message IDs (no urandom read per message)
+_pid = os.getpid()
+_counter = itertools.count(1)
+
 class A2AMessage:
     """
     JSON-RPC 2.0 message format for A2A communication
     """
     
+    __slots__ = (
+        "jsonrpc", "method", "params", "from_agent", "to_agent", "id",
+        "timestamp_epoch", "_timestamp", "_dict_cache"
+    )
+    
     def __init__(
         self,
         method: str,
@@ -26,24 +71,53 @@ class A2AMessage:
         self.params = params
         self.from_agent = from_agent
         self.to_agent = to_agent
-        self.id = id or str(uuid.uuid4())
-        self.timestamp = datetime.now().isoformat()
+        self.id = id or f"{_pid}-{next(_counter)}"
+        self.timestamp_epoch = time.time()
+        self._timestamp = None
+        self._dict_cache = None
+    
+    def __setattr__(self, name: str, value: Any):
+        # Any field change invalidates the memoized to_dict()
+        object.__setattr__(self, name, value)
+        if name != "_dict_cache":
+            object.__setattr__(self, "_dict_cache", None)
+    
+    @property
+    def timestamp(self) -> str:
+        """ISO-8601 timestamp, formatted lazily from timestamp_epoch"""
+        if self._timestamp is None:
+            self._timestamp = datetime.fromtimestamp(self.timestamp_epoch).isoformat()
+        return self._timestamp
+    
+    @timestamp.setter
+    def timestamp(self, value: str):
+        self._timestamp = value
     
     def to_dict(self) -> Dict[str, Any]:
-        """Convert message to dictionary"""
-        return {
-            "jsonrpc": self.jsonrpc,
-            "method": self.method,
-            "params": self.params,
-            "id": self.id,
-            "from_agent": self.from_agent,
-            "to_agent": self.to_agent,
-            "timestamp": self.timestamp
-        }
+        """Convert message to dictionary (memoized until a field is reassigned)"""
+        if self._dict_cache is None:
+            self._dict_cache = {
+                "jsonrpc": self.jsonrpc,
+                "method": self.method,
+                "params": self.params,
+                "id": self.id,
+                "from_agent": self.from_agent,
+                "to_agent": self.to_agent,
+                "timestamp": self.timestamp
+            }
+        return self._dict_cache
     
-    def to_json(self) -> str:
-        """Convert message to JSON string"""
-        return json.dumps(self.to_dict(), indent=2)
+    def to_json(self, pretty: bool = False) -> str:
+        """Convert message to compact JSON string (indented if pretty=True)"""
+        return _dumps(self.to_dict(), pretty)
+    
+    def to_pretty_json(self) -> str:
+        """Convert message to indented JSON string for human-facing logs"""
+        return _dumps(self.to_dict(), pretty=True)
+    
+    def to_bytes(self) -> bytes:
+        """Convert message to compact UTF-8 JSON bytes for transports"""
+        return _dumps_bytes(self.to_dict())
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'A2AMessage':
@@ -60,9 +134,9 @@ class A2AMessage:
         return msg
     
     @classmethod
-    def from_json(cls, json_str: str) -> 'A2AMessage':
-        """Create message from JSON string"""
-        data = json.loads(json_str)
+    def from_json(cls, json_str: Union[str, bytes]) -> 'A2AMessage':
+        """Create message from JSON string or UTF-8 bytes"""
+        data = _loads(json_str)
         return cls.from_dict(data)
 
 
@@ -71,6 +145,11 @@ class A2AResponse:
     JSON-RPC 2.0 response format
     """
     
+    __slots__ = (
+        "jsonrpc", "result", "error", "id", "from_agent",
+        "timestamp_epoch", "_timestamp", "_dict_cache"
+    )
+    
     def __init__(
         self,
         result: Any = None,
@@ -83,10 +162,32 @@ class A2AResponse:
         self.error = error
         self.id = id
         self.from_agent = from_agent
-        self.timestamp = datetime.now().isoformat()
+        self.timestamp_epoch = time.time()
+        self._timestamp = None
+        self._dict_cache = None
+    
+    def __setattr__(self, name: str, value: Any):
+        # Any field change invalidates the memoized to_dict()
+        object.__setattr__(self, name, value)
+        if name != "_dict_cache":
+            object.__setattr__(self, "_dict_cache", None)
+    
+    @property
+    def timestamp(self) -> str:
+        """ISO-8601 timestamp, formatted lazily from timestamp_epoch"""
+        if self._timestamp is None:
+            self._timestamp = datetime.fromtimestamp(self.timestamp_epoch).isoformat()
+        return self._timestamp
+    
+    @timestamp.setter
+    def timestamp(self, value: str):
+        self._timestamp = value
     
     def to_dict(self) -> Dict[str, Any]:
-        """Convert response to dictionary"""
+        """Convert response to dictionary (memoized until a field is reassigned)"""
+        if self._dict_cache is not None:
+            return self._dict_cache
+        
         response = {
             "jsonrpc": self.jsonrpc,
             "id": self.id,
@@ -99,11 +200,20 @@ class A2AResponse:
         else:
             response["result"] = self.result
         
+        self._dict_cache = response
         return response
     
-    def to_json(self) -> str:
-        """Convert response to JSON string"""
-        return json.dumps(self.to_dict(), indent=2)
+    def to_json(self, pretty: bool = False) -> str:
+        """Convert response to compact JSON string (indented if pretty=True)"""
+        return _dumps(self.to_dict(), pretty)
+    
+    def to_pretty_json(self) -> str:
+        """Convert response to indented JSON string for human-facing logs"""
+        return _dumps(self.to_dict(), pretty=True)
+    
+    def to_bytes(self) -> bytes:
+        """Convert response to compact UTF-8 JSON bytes for transports"""
+        return _dumps_bytes(self.to_dict())
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'A2AResponse':
@@ -119,67 +229,103 @@ class A2AResponse:
         return resp
     
     @classmethod
-    def from_json(cls, json_str: str) -> 'A2AResponse':
-        """Create response from JSON string"""
-        data = json.loads(json_str)
+    def from_json(cls, json_str: Union[str, bytes]) -> 'A2AResponse':
+        """Create response from JSON string or UTF-8 bytes"""
+        data = _loads(json_str)
         return cls.from_dict(data)
 
 
+# Gates the stdout echo of A2A traffic; messages are always recorded for summary()
+_log = logging.getLogger("a2a_protocol")
+
+
 class A2ALogger:
     """
     Logger for A2A communication
     Tracks all inter-agent messages for debugging and analysis
     """
     
-    def __init__(self):
-        self.messages = []
+    def __init__(self, flush_threshold: int = 64, max_messages: int = 10000):
+        # (kind, A2AMessage | A2AResponse) pairs; dicts are built only on export.
+        # Bounded so long-running agents don't grow the log forever.
+        self.messages = deque(maxlen=max_messages)
+        # Formatted log entries waiting to be written to stdout
+        self._buf: list[str] = []
+        self._flush_threshold = flush_threshold
+    
+    def _emit(self, entry: str):
+        """Buffer a formatted log entry, writing out once the batch is full"""
+        self._buf.append(entry)
+        if len(self._buf) >= self._flush_threshold:
+            self.flush()
+    
+    def flush(self):
+        """Write all buffered log entries to stdout in a single call"""
+        if self._buf:
+            sys.stdout.write("\n".join(self._buf) + "\n")
+            sys.stdout.flush()
+            self._buf.clear()
     
     def log_message(self, message: A2AMessage):
-        """Log an A2A message"""
-        self.messages.append({
-            "type": "message",
-            "data": message.to_dict()
-        })
-        print(f"\n[A2A MESSAGE] {message.from_agent} → {message.to_agent}")
-        print(f"  Method: {message.method}")
-        print(f"  ID: {message.id}")
+        """Log an A2A message (echoed to stdout only at INFO level or below)"""
+        self.messages.append(("message", message))
+        if not _log.isEnabledFor(logging.INFO):
+            return
+        self._emit(
+            f"\n[A2A MESSAGE] {message.from_agent} → {message.to_agent}\n"
+            f"  Method: {message.method}\n"
+            f"  ID: {message.id}"
+        )
     
     def log_response(self, response: A2AResponse):
-        """Log an A2A response"""
-        self.messages.append({
-            "type": "response",
-            "data": response.to_dict()
-        })
-        print(f"\n[A2A RESPONSE] {response.from_agent}")
-        print(f"  ID: {response.id}")
+        """Log an A2A response (echoed to stdout only at INFO level or below)"""
+        self.messages.append(("response", response))
+        if not _log.isEnabledFor(logging.INFO):
+            return
         if response.error:
-            print(f"  Error: {response.error}")
+            status = f"  Error: {response.error}"
         else:
-            print(f"  Success: Response returned")
+            status = "  Success: Response returned"
+        self._emit(
+            f"\n[A2A RESPONSE] {response.from_agent}\n"
+            f"  ID: {response.id}\n"
+            f"{status}"
+        )
+    
+    @staticmethod
+    def _export(kind: str, obj) -> Dict[str, Any]:
+        """Materialize a logged (kind, object) pair into its exported dict form"""
+        return {"type": kind, "data": obj.to_dict()}
     
     def get_conversation(self, message_id: str) -> list:
         """Get all messages related to a specific message ID"""
         return [
-            msg for msg in self.messages
-            if msg["data"].get("id") == message_id
+            self._export(kind, obj) for kind, obj in self.messages
+            if obj.id == message_id
         ]
     
     def get_all_messages(self) -> list:
         """Get all logged messages"""
-        return self.messages
+        return [self._export(kind, obj) for kind, obj in self.messages]
     
     def clear(self):
         """Clear all logged messages"""
-        self.messages = []
+        self.messages.clear()
+    
+    def configure(self, max_messages: Optional[int] = None):
+        """Change how many recent messages are retained (oldest dropped first)"""
+        if max_messages is not None:
+            self.messages = deque(self.messages, maxlen=max_messages)
     
     def summary(self) -> Dict[str, Any]:
         """Get summary of A2A communications"""
+        self.flush()
         total = len(self.messages)
-        messages = sum(1 for m in self.messages if m["type"] == "message")
-        responses = sum(1 for m in self.messages if m["type"] == "response")
+        messages = sum(1 for kind, _ in self.messages if kind == "message")
+        responses = total - messages
         errors = sum(
-            1 for m in self.messages
-            if m["type"] == "response" and m["data"].get("error")
+            1 for kind, obj in self.messages
+            if kind == "response" and obj.error
         )
         
         return {
@@ -192,3 +338,4 @@ class A2ALogger:
 
 # Global logger instance
 a2a_logger = A2ALogger()
+atexit.register(a2a_logger.flush)
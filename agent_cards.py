@@ -3,7 +3,9 @@ Agent Cards - Define capabilities and interfaces for each agent
 Based on A2A protocol specifications
 """
 
-from typing import Dict, List, Any
+import sys
+from types import MappingProxyType
+from typing import Dict, List, Any, Mapping, Optional, Tuple
 
 # Router Agent Card
 ROUTER_AGENT_CARD = {
@@ -102,6 +104,14 @@ DATA_AGENT_CARD = {
             "returns": "Customer object with ticket array",
             "mcp_tool": "get_customer_history"
         },
+        {
+            "name": "get_customer_full",
+            "description": "Get customer record and ticket history in one call",
+            "parameters": {
+                "customer_id": "integer"
+            },
+            "returns": "Object with customer and history results"
+        },
         {
             "name": "create_ticket",
             "description": "Create new support ticket",
@@ -123,6 +133,15 @@ DATA_AGENT_CARD = {
             },
             "returns": "Array of ticket objects",
             "mcp_tool": "get_tickets"
+        },
+        {
+            "name": "query_active_with_open_tickets",
+            "description": "Get open tickets belonging to active customers",
+            "parameters": {
+                "limit": "integer (optional, default 50)"
+            },
+            "returns": "Array of ticket objects with customer name/email",
+            "mcp_tool": "query_active_with_open_tickets"
         }
     ],
     "mcp_server": "customer-service-mcp",
@@ -184,27 +203,65 @@ SUPPORT_AGENT_CARD = {
     "llm_model": "gemini-1.5-pro"
 }
 
+def _freeze(value: Any) -> Any:
+    """Recursively make a card read-only: dicts -> MappingProxyType, lists -> tuples, keys interned"""
+    if isinstance(value, dict):
+        return MappingProxyType({sys.intern(k): _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def card_to_dict(card: Mapping[str, Any]) -> Dict[str, Any]:
+    """Plain dict/list copy of a frozen card, for JSON serialization or editing"""
+    return _thaw(card)
+
+def _thaw(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+# Cards are static, so freeze them to prevent accidental mutation
+# (serialize them through card_to_dict)
+ROUTER_AGENT_CARD = _freeze(ROUTER_AGENT_CARD)
+DATA_AGENT_CARD = _freeze(DATA_AGENT_CARD)
+SUPPORT_AGENT_CARD = _freeze(SUPPORT_AGENT_CARD)
+
 # Agent registry
-AGENT_REGISTRY = {
+AGENT_REGISTRY: Mapping[str, Mapping[str, Any]] = MappingProxyType({
     "router_agent": ROUTER_AGENT_CARD,
     "data_agent": DATA_AGENT_CARD,
     "support_agent": SUPPORT_AGENT_CARD
-}
+})
 
-def get_agent_card(agent_id: str) -> Dict[str, Any]:
+def get_agent_card(agent_id: str) -> Optional[Mapping[str, Any]]:
     """Get agent card by ID"""
     return AGENT_REGISTRY.get(agent_id)
 
-def list_all_agents() -> List[Dict[str, Any]]:
+def list_all_agents() -> List[Mapping[str, Any]]:
     """List all registered agents"""
     return list(AGENT_REGISTRY.values())
 
-def get_agent_capabilities(agent_id: str) -> List[str]:
-    """Get list of capabilities for an agent"""
-    card = get_agent_card(agent_id)
-    return card.get("capabilities", []) if card else []
+# Flat lookups precomputed from the (static) registry
+_CAPS: Dict[str, Tuple[str, ...]] = {
+    aid: card["capabilities"] for aid, card in AGENT_REGISTRY.items()
+}
+_METHODS: Dict[str, Tuple[Mapping[str, Any], ...]] = {
+    aid: card["methods"] for aid, card in AGENT_REGISTRY.items()
+}
+_METHOD_BY_NAME: Dict[str, Dict[str, Mapping[str, Any]]] = {
+    aid: {m["name"]: m for m in card["methods"]} for aid, card in AGENT_REGISTRY.items()
+}
+
+def get_agent_capabilities(agent_id: str) -> Tuple[str, ...]:
+    """Get capabilities for an agent"""
+    return _CAPS.get(agent_id, ())
+
+def get_agent_methods(agent_id: str) -> Tuple[Mapping[str, Any], ...]:
+    """Get methods for an agent"""
+    return _METHODS.get(agent_id, ())
 
-def get_agent_methods(agent_id: str) -> List[Dict[str, Any]]:
-    """Get list of methods for an agent"""
-    card = get_agent_card(agent_id)
-    return card.get("methods", []) if card else []
+def get_agent_method(agent_id: str, method_name: str) -> Optional[Mapping[str, Any]]:
+    """Get a single method definition for an agent by name"""
+    return _METHOD_BY_NAME.get(agent_id, {}).get(method_name)
@@ -0,0 +1,671 @@
+"""
+Customer Database Layer
+SQLite operations behind the customer service MCP tools
+Shared by the MCP server (stdio) and the in-process MCP client
+"""
+
+import re
+import sqlite3
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from itertools import repeat
+from pathlib import Path
+from typing import Any
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+# Database path
+DB_PATH = "support.db"
+
+# Single long-lived connection shared by all tool calls. Tool calls run in
+# worker threads, so every use of the connection is serialized by _DB_LOCK.
+_CONN = None
+_DB_LOCK = threading.RLock()
+
+def get_db_connection():
+    """Get the shared database connection (opened on first use)"""
+    global _CONN
+    with _DB_LOCK:
+        if _CONN is None:
+            # mode=rw: a missing support.db is an error, not a new empty file.
+            # Autocommit: single writes commit on their own, batches use BEGIN IMMEDIATE
+            conn = sqlite3.connect(
+                Path(DB_PATH).resolve().as_uri() + "?mode=rw",
+                uri=True,
+                check_same_thread=False,
+                isolation_level=None
+            )
+            try:
+                conn.execute("PRAGMA foreign_keys = ON")
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute("PRAGMA synchronous = NORMAL")
+                conn.execute("PRAGMA temp_store = MEMORY")
+                conn.execute("PRAGMA cache_size = -20000")
+                _ensure_indexes(conn)
+            except BaseException:
+                conn.close()
+                raise
+            _CONN = conn
+        return _CONN
+
+def _ensure_indexes(conn):
+    """Create the indexes behind the hot ticket/customer filters (for databases set up before them)"""
+    # customer history: WHERE customer_id = ? ORDER BY created_at DESC
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tickets_customer_created "
+        "ON tickets(customer_id, created_at DESC)"
+    )
+    # get_tickets: WHERE status = ? AND priority = ? ORDER BY created_at DESC
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tickets_status_priority_created "
+        "ON tickets(status, priority, created_at DESC)"
+    )
+    # list_customers: WHERE status = ?
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_status ON customers(status)")
+
+# In-process MCP clients holding the shared connection; the last one to
+# release it closes it
+_CONN_USERS = 0
+
+def acquire_db_connection():
+    """Register a user of the shared connection (see release_db_connection)"""
+    global _CONN_USERS
+    with _DB_LOCK:
+        conn = get_db_connection()
+        # Count the user only once the connection actually opened
+        _CONN_USERS += 1
+        return conn
+
+def release_db_connection():
+    """Drop a user of the shared connection, closing it when none are left"""
+    global _CONN_USERS
+    with _DB_LOCK:
+        _CONN_USERS = max(_CONN_USERS - 1, 0)
+        if _CONN_USERS == 0:
+            close_db_connection()
+
+def close_db_connection():
+    """Close the shared database connection if it is open"""
+    global _CONN
+    with _DB_LOCK:
+        if _CONN is not None:
+            _CONN.close()
+            _CONN = None
+        _invalidate_customer_caches()
+
+# ============================================================================
+# Tool Routing
+# ============================================================================
+
+# Input schemas for every tool (also advertised by mcp_server.list_tools)
+TOOL_SCHEMAS = {
+    "get_customer": {
+        "type": "object",
+        "properties": {
+            "customer_id": {
+                "type": "integer",
+                "description": "The unique customer ID"
+            }
+        },
+        "required": ["customer_id"]
+    },
+    "list_customers": {
+        "type": "object",
+        "properties": {
+            "status": {
+                "type": "string",
+                "enum": ["active", "disabled", "all"],
+                "description": "Filter customers by status",
+                "default": "all"
+            },
+            "limit": {
+                "type": "integer",
+                "description": "Maximum number of customers to return",
+                "default": 10,
+                "minimum": 1,
+                "maximum": 100
+            }
+        }
+    },
+    "update_customer": {
+        "type": "object",
+        "properties": {
+            "customer_id": {
+                "type": "integer",
+                "description": "Customer ID to update"
+            },
+            "name": {
+                "type": "string",
+                "description": "New customer name"
+            },
+            "email": {
+                "type": "string",
+                "description": "New email address"
+            },
+            "phone": {
+                "type": "string",
+                "description": "New phone number"
+            },
+            "status": {
+                "type": "string",
+                "enum": ["active", "disabled"],
+                "description": "New account status"
+            }
+        },
+        "required": ["customer_id"]
+    },
+    "create_ticket": {
+        "type": "object",
+        "properties": {
+            "customer_id": {
+                "type": "integer",
+                "description": "Customer ID who created the ticket"
+            },
+            "issue": {
+                "type": "string",
+                "description": "Description of the issue"
+            },
+            "priority": {
+                "type": "string",
+                "enum": ["low", "medium", "high"],
+                "default": "medium",
+                "description": "Priority level of the ticket"
+            }
+        },
+        "required": ["customer_id", "issue"]
+    },
+    "get_customer_history": {
+        "type": "object",
+        "properties": {
+            "customer_id": {
+                "type": "integer",
+                "description": "Customer ID to get ticket history for"
+            },
+            "limit": {
+                "type": "integer",
+                "description": "Maximum number of tickets to return (newest first)",
+                "default": 100,
+                "minimum": 1
+            }
+        },
+        "required": ["customer_id"]
+    },
+    "get_tickets": {
+        "type": "object",
+        "properties": {
+            "status": {
+                "type": "string",
+                "enum": ["open", "in_progress", "resolved", "all"],
+                "description": "Filter by ticket status",
+                "default": "all"
+            },
+            "priority": {
+                "type": "string",
+                "enum": ["low", "medium", "high", "all"],
+                "description": "Filter by priority level",
+                "default": "all"
+            },
+            "customer_ids": {
+                "type": "array",
+                "items": {"type": "integer"},
+                "description": "Filter by specific customer IDs"
+            },
+            "limit": {
+                "type": "integer",
+                "description": "Maximum number of tickets to return (newest first)",
+                "default": 100,
+                "minimum": 1
+            }
+        }
+    },
+    "query_active_with_open_tickets": {
+        "type": "object",
+        "properties": {
+            "limit": {
+                "type": "integer",
+                "description": "Maximum number of tickets to return (newest first)",
+                "default": 50,
+                "minimum": 1
+            }
+        }
+    },
+    "batch_execute": {
+        "type": "object",
+        "properties": {
+            "operations": {
+                "type": "array",
+                "description": "Tool calls to run in order",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "tool": {
+                            "type": "string",
+                            "description": "Name of the tool to call"
+                        },
+                        "args": {
+                            "type": "object",
+                            "description": "Arguments for the tool"
+                        }
+                    },
+                    "required": ["tool"]
+                }
+            }
+        },
+        "required": ["operations"]
+    }
+}
+
+# Validators are compiled once at import; they also fill in schema defaults.
+# Without fastjsonschema the arguments pass through unchecked and the
+# handlers' .get() defaults apply.
+if fastjsonschema is not None:
+    _VALIDATORS = {name: fastjsonschema.compile(schema) for name, schema in TOOL_SCHEMAS.items()}
+else:
+    _VALIDATORS = {}
+
+# Integer and integer-array properties per tool. IDs sent as numeric strings
+# ("5") are converted before validation, as the tools accepted them before
+# schemas were enforced.
+_INT_FIELDS = {
+    name: tuple(k for k, v in schema.get("properties", {}).items() if v.get("type") == "integer")
+    for name, schema in TOOL_SCHEMAS.items()
+}
+_INT_LIST_FIELDS = {
+    name: tuple(
+        k for k, v in schema.get("properties", {}).items()
+        if v.get("type") == "array" and v.get("items", {}).get("type") == "integer"
+    )
+    for name, schema in TOOL_SCHEMAS.items()
+}
+_INT_STR_RE = re.compile(r"\s*-?\d+\s*\Z", re.ASCII)
+
+def _as_int(value):
+    if isinstance(value, str) and _INT_STR_RE.match(value):
+        return int(value)
+    return value
+
+def _prepare_args(name: str, arguments: Any):
+    """Copy of a tool's arguments with numeric strings in integer fields converted"""
+    if not isinstance(arguments, dict):
+        return arguments
+    # Validators fill in defaults in place, so never hand them the caller's dict
+    arguments = dict(arguments)
+    for field in _INT_FIELDS.get(name, ()):
+        if field in arguments:
+            arguments[field] = _as_int(arguments[field])
+    for field in _INT_LIST_FIELDS.get(name, ()):
+        if isinstance(arguments.get(field), list):
+            arguments[field] = [_as_int(v) for v in arguments[field]]
+    return arguments
+
+# Built once at import; handlers resolve the database functions at call time
+_DISPATCH = {
+    "get_customer": lambda a: _get_customer(a["customer_id"]),
+    "list_customers": lambda a: _list_customers(
+        status=a.get("status", "all"),
+        limit=a.get("limit", 10)
+    ),
+    "update_customer": lambda a: _update_customer(
+        customer_id=a["customer_id"],
+        name=a.get("name"),
+        email=a.get("email"),
+        phone=a.get("phone"),
+        status=a.get("status")
+    ),
+    "create_ticket": lambda a: _create_ticket(
+        customer_id=a["customer_id"],
+        issue=a["issue"],
+        priority=a.get("priority", "medium")
+    ),
+    "get_customer_history": lambda a: _get_customer_history(
+        a["customer_id"],
+        limit=a.get("limit", 100)
+    ),
+    "get_tickets": lambda a: _get_tickets(
+        status=a.get("status", "all"),
+        priority=a.get("priority", "all"),
+        customer_ids=a.get("customer_ids"),
+        limit=a.get("limit", 100)
+    ),
+    "query_active_with_open_tickets": lambda a: _active_customers_with_open_tickets(
+        limit=a.get("limit", 50)
+    ),
+    "batch_execute": lambda a: _batch_execute(a["operations"]),
+}
+
+def _run_tool(name: str, arguments: Any):
+    """Route a tool call to its database operation (blocking)"""
+    handler = _DISPATCH.get(name)
+    if handler is None:
+        return {"error": f"Unknown tool: {name}"}
+    
+    arguments = _prepare_args(name, arguments)
+    validate = _VALIDATORS.get(name)
+    if validate is not None:
+        try:
+            arguments = validate(arguments)
+        except fastjsonschema.JsonSchemaException as e:
+            return {"error": f"Invalid arguments for {name}: {e.message}", "tool": name}
+    
+    return handler(arguments)
+
+# ============================================================================
+# Database Operations
+# ============================================================================
+
+def _fetch_dicts(cursor, query, params=()):
+    """
+    Run a query and build one dict per row
+    Column names are read once from cursor.description and rows are
+    streamed as plain tuples; the zip/dict construction runs through map()
+    so the loop stays in C
+    """
+    cursor.execute(query, params)
+    cols = tuple(d[0] for d in cursor.description)
+    return list(map(dict, map(zip, repeat(cols), cursor)))
+
+def _fetch_pairs(cursor, query, params=()):
+    """Run a single-row query and return its (column, value) pairs, or None"""
+    cursor.execute(query, params)
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return tuple(zip([d[0] for d in cursor.description], row))
+
+# Read cache for the customer lookups: key -> (stored_at, value), where values
+# are frozen tuples of (column, value) pairs so every caller gets a fresh
+# dict. Lookup, fill and invalidation all hold _DB_LOCK, so a read racing a
+# write can't store a row the write already replaced. Entries also expire
+# after _CUSTOMER_CACHE_TTL seconds, which bounds how long changes made by
+# another process (e.g. the stdio MCP server) stay invisible here.
+_CUSTOMER_CACHE_TTL = 5.0
+_CUSTOMER_CACHE_MAX = 512
+_customer_cache = OrderedDict()
+
+def _cached_read(key, load):
+    """Return the cached value for key, or run load(cursor) and cache it"""
+    with _DB_LOCK:
+        now = time.monotonic()
+        entry = _customer_cache.get(key)
+        if entry is not None and now - entry[0] < _CUSTOMER_CACHE_TTL:
+            _customer_cache.move_to_end(key)
+            return entry[1]
+        
+        value = load(get_db_connection().cursor())
+        _customer_cache[key] = (now, value)
+        _customer_cache.move_to_end(key)
+        while len(_customer_cache) > _CUSTOMER_CACHE_MAX:
+            _customer_cache.popitem(last=False)
+        return value
+
+def _cached_customer(customer_id):
+    return _cached_read(("customer", customer_id), lambda cursor: _fetch_pairs(
+        cursor,
+        "SELECT * FROM customers WHERE id = ?",
+        (customer_id,)
+    ))
+
+def _cached_customer_list(status, limit):
+    def load(cursor):
+        if status == "all":
+            customers = _fetch_dicts(cursor, "SELECT * FROM customers LIMIT ?", (limit,))
+        else:
+            customers = _fetch_dicts(
+                cursor,
+                "SELECT * FROM customers WHERE status = ? LIMIT ?",
+                (status, limit)
+            )
+        return tuple(tuple(c.items()) for c in customers)
+    
+    return _cached_read(("customers", status, limit), load)
+
+def _invalidate_customer_caches():
+    """Drop cached customer reads after a write"""
+    with _DB_LOCK:
+        _customer_cache.clear()
+
+def _get_customer(customer_id: int):
+    """Get customer by ID"""
+    row = _cached_customer(customer_id)
+    
+    if row:
+        return {
+            "success": True,
+            "customer": dict(row)
+        }
+    return {"error": "Customer not found", "customer_id": customer_id}
+
+def _list_customers(status="all", limit=10):
+    """List customers with optional status filter"""
+    customers = list(map(dict, _cached_customer_list(status, limit)))
+    
+    return {
+        "success": True,
+        "count": len(customers),
+        "customers": customers
+    }
+
+def _update_customer(customer_id, name=None, email=None, phone=None, status=None):
+    """Update customer information"""
+    fields = []
+    values = []
+    
+    # Build dynamic UPDATE query
+    if name:
+        fields.append("name = ?")
+        values.append(name)
+    if email:
+        fields.append("email = ?")
+        values.append(email)
+    if phone:
+        fields.append("phone = ?")
+        values.append(phone)
+    if status:
+        fields.append("status = ?")
+        values.append(status)
+    
+    if not fields:
+        return {"error": "No fields to update"}
+    
+    # Add updated_at timestamp
+    values.append(datetime.now().isoformat())
+    values.append(customer_id)
+    
+    with _DB_LOCK:
+        cursor = get_db_connection().cursor()
+        
+        query = f"UPDATE customers SET {', '.join(fields)}, updated_at = ? WHERE id = ?"
+        cursor.execute(query, values)
+        _invalidate_customer_caches()
+        
+        if cursor.rowcount > 0:
+            # Fetch updated customer
+            row = _fetch_pairs(cursor, "SELECT * FROM customers WHERE id = ?", (customer_id,))
+            return {
+                "success": True,
+                "message": "Customer updated successfully",
+                "customer": dict(row)
+            }
+    
+    return {"error": "Customer not found or no changes made", "customer_id": customer_id}
+
+def _create_ticket(customer_id, issue, priority="medium"):
+    """Create new support ticket"""
+    with _DB_LOCK:
+        cursor = get_db_connection().cursor()
+        
+        # Existence check, insert and fetch in one statement (SQLite 3.35+ RETURNING)
+        row = _fetch_pairs(cursor, """
+            INSERT INTO tickets (customer_id, issue, status, priority)
+            SELECT ?, ?, 'open', ?
+            WHERE EXISTS (SELECT 1 FROM customers WHERE id = ?)
+            RETURNING *
+        """, (customer_id, issue, priority, customer_id))
+    
+    if row is None:
+        return {"error": "Customer not found", "customer_id": customer_id}
+    
+    return {
+        "success": True,
+        "message": "Ticket created successfully",
+        "ticket": dict(row)
+    }
+
+def _get_customer_history(customer_id, limit=100):
+    """Get a customer's most recent tickets (newest first)"""
+    with _DB_LOCK:
+        cursor = get_db_connection().cursor()
+        
+        # Verify customer exists
+        customer = _fetch_pairs(cursor, "SELECT * FROM customers WHERE id = ?", (customer_id,))
+        
+        if not customer:
+            return {"error": "Customer not found", "customer_id": customer_id}
+        
+        # Get tickets
+        tickets = _fetch_dicts(
+            cursor,
+            "SELECT * FROM tickets WHERE customer_id = ? ORDER BY created_at DESC LIMIT ?",
+            (customer_id, limit)
+        )
+    
+    return {
+        "success": True,
+        "customer": dict(customer),
+        "ticket_count": len(tickets),
+        "tickets": tickets
+    }
+
+@lru_cache(maxsize=None)
+def _get_tickets_sql(by_status: bool, by_priority: bool, by_customers: bool) -> str:
+    """
+    Build the SQL for one filter combination (at most 8 distinct strings)
+    Stable statement text lets sqlite3's statement cache skip re-parsing
+    """
+    query = "SELECT * FROM tickets WHERE 1=1"
+    if by_status:
+        query += " AND status = ?"
+    if by_priority:
+        query += " AND priority = ?"
+    if by_customers:
+        # Bind the whole ID list as one JSON array so the text doesn't vary with its length
+        query += " AND customer_id IN (SELECT value FROM json_each(?))"
+    # LIMIT is always bound so it doesn't add variants
+    return query + " ORDER BY created_at DESC LIMIT ?"
+
+def _get_tickets(status="all", priority="all", customer_ids=None, limit=100):
+    """Query tickets with filters (newest first, at most `limit` rows)"""
+    by_status = status != "all"
+    by_priority = priority != "all"
+    by_customers = bool(customer_ids)
+    
+    params = []
+    if by_status:
+        params.append(status)
+    if by_priority:
+        params.append(priority)
+    if by_customers:
+        params.append(json.dumps(customer_ids))
+    params.append(limit)
+    
+    query = _get_tickets_sql(by_status, by_priority, by_customers)
+    
+    with _DB_LOCK:
+        tickets = _fetch_dicts(get_db_connection().cursor(), query, params)
+    
+    return {
+        "success": True,
+        "count": len(tickets),
+        "tickets": tickets
+    }
+
+def _active_customers_with_open_tickets(limit=50):
+    """Get the newest open tickets of active customers with one indexed JOIN"""
+    with _DB_LOCK:
+        cursor = get_db_connection().cursor()
+        cursor.execute("SELECT COUNT(*) FROM customers WHERE status = 'active'")
+        active_count = cursor.fetchone()[0]
+        
+        tickets = _fetch_dicts(cursor, """
+            SELECT t.*, c.name AS customer_name, c.email AS customer_email
+            FROM tickets t
+            JOIN customers c ON c.id = t.customer_id
+            WHERE c.status = 'active' AND t.status = 'open'
+            ORDER BY t.created_at DESC
+            LIMIT ?
+        """, (limit,))
+    
+    return {
+        "success": True,
+        "active_customers_count": active_count,
+        "customer_count": len({t["customer_id"] for t in tickets}),
+        "count": len(tickets),
+        "tickets": tickets
+    }
+
+# Tools that change the database; a failure in one of them aborts a batch
+_WRITE_TOOLS = frozenset({"update_customer", "create_ticket"})
+
+def _batch_execute(operations):
+    """
+    Run several tool calls inside one transaction
+    Returns per-operation {ok, value|error} results in request order. A
+    failed read (e.g. customer not found) is just reported; a failed write
+    or any exception stops the batch and rolls every change back
+    """
+    results = []
+    failed = None
+    
+    with _DB_LOCK:
+        conn = get_db_connection()
+        # The connection is in autocommit mode; take the write lock up front so
+        # the whole batch commits (and syncs) once instead of per statement
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for index, op in enumerate(operations):
+                tool = op.get("tool")
+                abort = tool in _WRITE_TOOLS
+                if tool == "batch_execute":
+                    result = {"ok": False, "error": "Nested batch_execute is not allowed"}
+                else:
+                    try:
+                        value = _run_tool(tool, op.get("args", {}))
+                    except Exception as e:
+                        result = {"ok": False, "error": str(e)}
+                        abort = True
+                    else:
+                        if isinstance(value, dict) and "error" in value:
+                            result = {"ok": False, "error": value["error"], "value": value}
+                        else:
+                            result = {"ok": True, "value": value}
+                results.append(result)
+                if not result["ok"] and abort:
+                    failed = index
+                    break
+        except BaseException:
+            conn.execute("ROLLBACK")
+            _invalidate_customer_caches()
+            raise
+        
+        if failed is not None:
+            conn.execute("ROLLBACK")
+            _invalidate_customer_caches()
+            return {
+                "error": f"Operation {failed} ({operations[failed].get('tool')}) failed; batch rolled back",
+                "count": len(results),
+                "results": results
+            }
+        conn.execute("COMMIT")
+    
+    return {
+        "success": True,
+        "count": len(results),
+        "results": results
+    }
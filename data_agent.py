@@ -3,21 +3,105 @@ Customer Data Agent
 Uses Gemini AI for data validation and MCP for database operations
 """
 
-import os
+import re
 import json
-import google.generativeai as genai
-from typing import Dict, Any, Optional
-from dotenv import load_dotenv
+import logging
+from typing import Dict, Any, Literal, Optional, Tuple
+from pydantic import BaseModel, ValidationError
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
 
 from a2a_protocol import A2AMessage, A2AResponse, a2a_logger
 from agent_cards import DATA_AGENT_CARD
 from mcp_client import MCPClient
+from gemini_cache import configure_once, shared_model
+
+logger = logging.getLogger("data_agent")
+
+# Load .env and configure Gemini (once per process)
+configure_once()
+
+# Well-formed emails are accepted locally without an LLM round-trip
+_EMAIL_RE = re.compile(r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$")
+
+def _batch_value(batch: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """One operation's result from a batch_execute response (or the batch's error)"""
+    results = batch.get("results", [])
+    if index < len(results):
+        entry = results[index]
+        return entry["value"] if "value" in entry else {"error": entry.get("error")}
+    return {"error": batch.get("error", "Batch operation did not run")}
+
+
+class UpdateCustomerParams(BaseModel):
+    """Local schema check for update_customer params"""
+    customer_id: int
+    name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    status: Optional[Literal["active", "disabled"]] = None
+
+
+def _format_validation_error(exc: ValidationError) -> str:
+    """Flatten a pydantic ValidationError into a single readable line"""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}"
+        for err in exc.errors()
+    )
 
-# Load environment variables
-load_dotenv()
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+def _parse_json_object(text: str) -> Dict[str, Any]:
+    """
+    Parse the outermost {...} in an LLM reply, ignoring ```json fences
+    Raises ValueError if the reply holds no JSON object
+    """
+    start = text.find("{")
+    end = text.rfind("}") + 1
+    if start < 0 or end <= start:
+        raise ValueError("no JSON object in reply")
+    value = _loads(text[start:end])
+    if not isinstance(value, dict):
+        raise ValueError("reply is not a JSON object")
+    return value
+
+
+# Gemini verdicts for emails the regex rejected: email -> (valid, message).
+# The verdict never changes, so it is shared by every agent instance.
+_EMAIL_VERDICTS: Dict[str, Tuple[bool, str]] = {}
+_EMAIL_VERDICTS_MAX = 1024
+
+
+async def _validate_email_llm(model, email: str) -> Tuple[bool, str]:
+    """Validate an email address with Gemini (cached per email)"""
+    verdict = _EMAIL_VERDICTS.get(email)
+    if verdict is not None:
+        return verdict
+    
+    validation_prompt = f"""
+Validate this email address: {email}
+
+Respond with JSON:
+{{
+    "valid": true/false,
+    "message": "explanation"
+}}
+"""
+    response = await model.generate_content_async(validation_prompt)
+    try:
+        validation = _parse_json_object(response.text)
+    except ValueError:
+        # Unreadable verdict: reject this time, but don't cache it
+        return False, "could not read Gemini's validation verdict"
+    verdict = (bool(validation.get("valid")), validation.get("message", ""))
+    
+    if len(_EMAIL_VERDICTS) >= _EMAIL_VERDICTS_MAX:
+        del _EMAIL_VERDICTS[next(iter(_EMAIL_VERDICTS))]
+    _EMAIL_VERDICTS[email] = verdict
+    return verdict
 
 
 class CustomerDataAgent:
@@ -38,16 +122,28 @@ class CustomerDataAgent:
         self.mcp_server_path = mcp_server_path
         self.mcp_client: Optional[MCPClient] = None
         
-        # Initialize Gemini
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        # Initialize Gemini (shared client)
+        self.model = shared_model()
         
-        print(f"[{self.agent_id}] Initialized with Gemini AI")
+        # A2A method name -> handler taking the raw params dict
+        self._dispatch = {
+            "get_customer": self._dispatch_get_customer,
+            "list_customers": self._dispatch_list_customers,
+            "update_customer": self._dispatch_update_customer,
+            "get_customer_history": self._dispatch_get_customer_history,
+            "create_ticket": self._dispatch_create_ticket,
+            "get_tickets": self._dispatch_get_tickets,
+            "get_customer_full": self._dispatch_get_customer_full,
+            "query_active_with_open_tickets": self._dispatch_query_active_with_open_tickets,
+        }
+        
+        logger.debug("[%s] Initialized with Gemini AI", self.agent_id)
     
     async def connect_mcp(self):
         """Connect to MCP server"""
         self.mcp_client = MCPClient(self.mcp_server_path)
         await self.mcp_client.connect()
-        print(f"[{self.agent_id}] Connected to MCP server")
+        logger.debug("[%s] Connected to MCP server", self.agent_id)
     
     async def handle_message(self, message: A2AMessage) -> A2AResponse:
         """
@@ -66,34 +162,9 @@ class CustomerDataAgent:
         
         try:
             # Route to appropriate method
-            if method == "get_customer":
-                result = await self.get_customer(params.get("customer_id"))
-            
-            elif method == "list_customers":
-                result = await self.list_customers(
-                    status=params.get("status", "all"),
-                    limit=params.get("limit", 10)
-                )
-            
-            elif method == "update_customer":
-                result = await self.update_customer(
-                    customer_id=params.get("customer_id"),
-                    **{k: v for k, v in params.items() if k != "customer_id"}
-                )
-            
-            elif method == "get_customer_history":
-                result = await self.get_customer_history(params.get("customer_id"))
-            
-            elif method == "create_ticket":
-                result = await self.create_ticket(
-                    customer_id=params.get("customer_id"),
-                    issue=params.get("issue"),
-                    priority=params.get("priority", "medium")
-                )
-            
-            elif method == "get_tickets":
-                result = await self.get_tickets(**params)
-            
+            handler = self._dispatch.get(method)
+            if handler:
+                result = await handler(params)
             else:
                 result = {"error": f"Unknown method: {method}"}
             
@@ -118,12 +189,50 @@ class CustomerDataAgent:
         a2a_logger.log_response(response)
         return response
     
+    # ------------------------------------------------------------------
+    # A2A dispatch handlers: unpack params and call the real method
+    # ------------------------------------------------------------------
+    
+    async def _dispatch_get_customer(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.get_customer(params.get("customer_id"))
+    
+    async def _dispatch_list_customers(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.list_customers(
+            status=params.get("status", "all"),
+            limit=params.get("limit", 10)
+        )
+    
+    async def _dispatch_update_customer(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.update_customer(
+            customer_id=params.get("customer_id"),
+            **{k: v for k, v in params.items() if k != "customer_id"}
+        )
+    
+    async def _dispatch_get_customer_history(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.get_customer_history(params.get("customer_id"))
+    
+    async def _dispatch_create_ticket(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.create_ticket(
+            customer_id=params.get("customer_id"),
+            issue=params.get("issue"),
+            priority=params.get("priority", "medium")
+        )
+    
+    async def _dispatch_get_tickets(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.get_tickets(**params)
+    
+    async def _dispatch_get_customer_full(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.get_customer_full(params.get("customer_id"))
+    
+    async def _dispatch_query_active_with_open_tickets(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.query_active_with_open_tickets(params.get("limit", 50))
+    
     async def get_customer(self, customer_id: int) -> Dict[str, Any]:
         """
         Get customer by ID
         Uses MCP tool
         """
-        print(f"[{self.agent_id}] → MCP Tool: get_customer (ID: {customer_id})")
+        logger.debug("[%s] → MCP Tool: get_customer (ID: %s)", self.agent_id, customer_id)
         
         result = await self.mcp_client.call_tool(
             "get_customer",
@@ -131,9 +240,9 @@ class CustomerDataAgent:
         )
         
         if result.get("success"):
-            print(f"[{self.agent_id}] ✓ Customer found")
+            logger.debug("[%s] ✓ Customer found", self.agent_id)
         else:
-            print(f"[{self.agent_id}] ✗ {result.get('error')}")
+            logger.debug("[%s] ✗ %s", self.agent_id, result.get('error'))
         
         return result
     
@@ -142,7 +251,7 @@ class CustomerDataAgent:
         List customers with filters
         Uses MCP tool
         """
-        print(f"[{self.agent_id}] → MCP Tool: list_customers (status: {status}, limit: {limit})")
+        logger.debug("[%s] → MCP Tool: list_customers (status: %s, limit: %s)", self.agent_id, status, limit)
         
         result = await self.mcp_client.call_tool(
             "list_customers",
@@ -150,9 +259,9 @@ class CustomerDataAgent:
         )
         
         if result.get("success"):
-            print(f"[{self.agent_id}] ✓ Found {result.get('count')} customers")
+            logger.debug("[%s] ✓ Found %s customers", self.agent_id, result.get('count'))
         else:
-            print(f"[{self.agent_id}] ✗ {result.get('error')}")
+            logger.debug("[%s] ✗ %s", self.agent_id, result.get('error'))
         
         return result
     
@@ -166,51 +275,53 @@ class CustomerDataAgent:
     ) -> Dict[str, Any]:
         """
         Update customer information
-        Uses Gemini to validate data before updating via MCP
+        Validates params locally before updating via MCP; Gemini is only
+        consulted for emails that fail the local format check
         """
-        print(f"[{self.agent_id}] Validating update for customer {customer_id}")
+        logger.debug("[%s] Validating update for customer %s", self.agent_id, customer_id)
+        
+        try:
+            params = UpdateCustomerParams(
+                customer_id=customer_id,
+                name=name,
+                email=email,
+                phone=phone,
+                status=status
+            )
+        except ValidationError as e:
+            return {
+                "error": f"Invalid update: {_format_validation_error(e)}",
+                "customer_id": customer_id
+            }
         
         # Build update data
-        update_data = {"customer_id": customer_id}
-        if name:
-            update_data["name"] = name
-        if email:
-            update_data["email"] = email
-        if phone:
-            update_data["phone"] = phone
-        if status:
-            update_data["status"] = status
-        
-        # Use Gemini to validate email format if provided
-        if email:
-            validation_prompt = f"""
-Validate this email address: {email}
-
-Respond with JSON:
-{{
-    "valid": true/false,
-    "message": "explanation"
-}}
-"""
-            response = self.model.generate_content(validation_prompt)
-            response_text = response.text.strip()
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
-            validation = json.loads(response_text)
-            
-            if not validation.get("valid"):
+        update_data = {"customer_id": params.customer_id}
+        if params.name:
+            update_data["name"] = params.name
+        if params.email:
+            update_data["email"] = params.email
+        if params.phone:
+            update_data["phone"] = params.phone
+        if params.status:
+            update_data["status"] = params.status
+        
+        # Validate email: regex locally, Gemini only for malformed addresses
+        if params.email and not _EMAIL_RE.match(params.email):
+            valid, message = await _validate_email_llm(self.model, params.email)
+            if not valid:
                 return {
-                    "error": f"Invalid email: {validation.get('message')}",
+                    "error": f"Invalid email: {message}",
                     "customer_id": customer_id
                 }
         
         # Call MCP tool
-        print(f"[{self.agent_id}] → MCP Tool: update_customer")
+        logger.debug("[%s] → MCP Tool: update_customer", self.agent_id)
         result = await self.mcp_client.call_tool("update_customer", update_data)
         
         if result.get("success"):
-            print(f"[{self.agent_id}] ✓ Customer updated")
+            logger.debug("[%s] ✓ Customer updated", self.agent_id)
         else:
-            print(f"[{self.agent_id}] ✗ {result.get('error')}")
+            logger.debug("[%s] ✗ %s", self.agent_id, result.get('error'))
         
         return result
     
@@ -219,7 +330,7 @@ Respond with JSON:
         Get customer ticket history
         Uses MCP tool
         """
-        print(f"[{self.agent_id}] → MCP Tool: get_customer_history (ID: {customer_id})")
+        logger.debug("[%s] → MCP Tool: get_customer_history (ID: %s)", self.agent_id, customer_id)
         
         result = await self.mcp_client.call_tool(
             "get_customer_history",
@@ -228,12 +339,26 @@ Respond with JSON:
         
         if result.get("success"):
             ticket_count = result.get("ticket_count", 0)
-            print(f"[{self.agent_id}] ✓ Found {ticket_count} tickets")
+            logger.debug("[%s] ✓ Found %s tickets", self.agent_id, ticket_count)
         else:
-            print(f"[{self.agent_id}] ✗ {result.get('error')}")
+            logger.debug("[%s] ✗ %s", self.agent_id, result.get('error'))
         
         return result
     
+    async def get_customer_full(self, customer_id: int) -> Dict[str, Any]:
+        """
+        Get customer record and ticket history together
+        Both MCP tool calls go out as one batch (one round-trip, one snapshot)
+        """
+        logger.debug("[%s] → MCP Tools: batch get_customer + get_customer_history (ID: %s)", self.agent_id, customer_id)
+        
+        batch = await self.mcp_client.call_batch([
+            {"tool": "get_customer", "args": {"customer_id": customer_id}},
+            {"tool": "get_customer_history", "args": {"customer_id": customer_id}}
+        ])
+        
+        return {"customer": _batch_value(batch, 0), "history": _batch_value(batch, 1)}
+    
     async def create_ticket(
         self,
         customer_id: int,
@@ -244,8 +369,8 @@ Respond with JSON:
         Create new support ticket
         Uses MCP tool
         """
-        print(f"[{self.agent_id}] → MCP Tool: create_ticket")
-        print(f"  Customer: {customer_id}, Priority: {priority}")
+        logger.debug("[%s] → MCP Tool: create_ticket", self.agent_id)
+        logger.debug("  Customer: %s, Priority: %s", customer_id, priority)
         
         result = await self.mcp_client.call_tool(
             "create_ticket",
@@ -258,9 +383,9 @@ Respond with JSON:
         
         if result.get("success"):
             ticket = result.get("ticket", {})
-            print(f"[{self.agent_id}] ✓ Ticket created (ID: {ticket.get('id')})")
+            logger.debug("[%s] ✓ Ticket created (ID: %s)", self.agent_id, ticket.get('id'))
         else:
-            print(f"[{self.agent_id}] ✗ {result.get('error')}")
+            logger.debug("[%s] ✗ %s", self.agent_id, result.get('error'))
         
         return result
     
@@ -274,7 +399,7 @@ Respond with JSON:
         Query tickets with filters
         Uses MCP tool
         """
-        print(f"[{self.agent_id}] → MCP Tool: get_tickets")
+        logger.debug("[%s] → MCP Tool: get_tickets", self.agent_id)
         
         params = {"status": status, "priority": priority}
         if customer_ids:
@@ -284,9 +409,25 @@ Respond with JSON:
         
         if result.get("success"):
             count = result.get("count", 0)
-            print(f"[{self.agent_id}] ✓ Found {count} tickets")
+            logger.debug("[%s] ✓ Found %s tickets", self.agent_id, count)
+        else:
+            logger.debug("[%s] ✗ %s", self.agent_id, result.get('error'))
+        
+        return result
+    
+    async def query_active_with_open_tickets(self, limit: int = 50) -> Dict[str, Any]:
+        """
+        Get open tickets of active customers
+        Uses MCP tool (single SQL JOIN)
+        """
+        logger.debug("[%s] → MCP Tool: query_active_with_open_tickets", self.agent_id)
+        
+        result = await self.mcp_client.call_tool("query_active_with_open_tickets", {"limit": limit})
+        
+        if result.get("success"):
+            logger.debug("[%s] ✓ Found %s open tickets", self.agent_id, result.get('count'))
         else:
-            print(f"[{self.agent_id}] ✗ {result.get('error')}")
+            logger.debug("[%s] ✗ %s", self.agent_id, result.get('error'))
         
         return result
     
@@ -294,4 +435,4 @@ Respond with JSON:
         """Disconnect from MCP server"""
         if self.mcp_client:
             await self.mcp_client.disconnect()
-            print(f"[{self.agent_id}] Disconnected from MCP server")
+            logger.debug("[%s] Disconnected from MCP server", self.agent_id)
@@ -2,6 +2,17 @@ import sqlite3
 from datetime import datetime
 from pathlib import Path
 
+# Seed INSERT statements, kept as constants so sqlite3's statement cache
+# reuses the same compiled statement for every executemany call
+INSERT_CUSTOMER_SQL = """
+    INSERT INTO customers (name, email, phone, status)
+    VALUES (?, ?, ?, ?)
+"""
+
+INSERT_TICKET_SQL = """
+    INSERT INTO tickets (customer_id, issue, status, priority)
+    VALUES (?, ?, ?, ?)
+"""
 
 class DatabaseSetup:
     """SQLite database setup for customer support system."""
@@ -20,6 +31,11 @@ class DatabaseSetup:
         """Establish database connection."""
         self.conn = sqlite3.connect(self.db_path)
         self.conn.execute("PRAGMA foreign_keys = ON")  # Enable foreign key constraints
+        self.conn.execute("PRAGMA journal_mode = WAL")  # Append-only log, no fsync per rollback journal
+        self.conn.execute("PRAGMA synchronous = NORMAL")  # Safe with WAL, fsync only at checkpoints
+        self.conn.execute("PRAGMA temp_store = MEMORY")
+        self.conn.execute("PRAGMA mmap_size = 268435456")  # 256 MiB
+        self.conn.execute("PRAGMA cache_size = -65536")  # 64 MiB
         self.cursor = self.conn.cursor()
         print(f"Connected to database: {self.db_path}")
 
@@ -65,6 +81,26 @@ class DatabaseSetup:
             CREATE INDEX IF NOT EXISTS idx_tickets_status ON tickets(status)
         """)
 
+        # Composite indexes for the MCP ticket filters (status + priority, customer history)
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tickets_status_priority_created
+            ON tickets(status, priority, created_at DESC)
+        """)
+
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tickets_customer_created
+            ON tickets(customer_id, created_at DESC)
+        """)
+
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_customers_status ON customers(status)
+        """)
+
+        # Superseded by idx_tickets_customer_created (same leading column)
+        self.cursor.execute("""
+            DROP INDEX IF EXISTS idx_tickets_customer_status
+        """)
+
         self.conn.commit()
         print("Tables created successfully!")
 
@@ -106,11 +142,6 @@ class DatabaseSetup:
             ("Michael Scott", "michael.scott@paper.com", "+1-555-0115", "active"),
         ]
 
-        self.cursor.executemany("""
-            INSERT INTO customers (name, email, phone, status)
-            VALUES (?, ?, ?, ?)
-        """, customers)
-
         # Sample tickets (25 tickets with various statuses and priorities)
         tickets = [
             # High priority tickets
@@ -145,12 +176,19 @@ class DatabaseSetup:
             (10, "Suggestion: add keyboard shortcuts", "open", "low"),
         ]
 
-        self.cursor.executemany("""
-            INSERT INTO tickets (customer_id, issue, status, priority)
-            VALUES (?, ?, ?, ?)
-        """, tickets)
+        # Single write transaction for both tables: one commit, one fsync
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            self.cursor.executemany(INSERT_CUSTOMER_SQL, customers)
+            self.cursor.executemany(INSERT_TICKET_SQL, tickets)
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+        # Refresh planner statistics so the composite indexes get picked
+        self.conn.execute("ANALYZE")
 
-        self.conn.commit()
         print("Sample data inserted successfully!")
         print(f"  - {len(customers)} customers added")
         print(f"  - {len(tickets)} tickets added")
@@ -0,0 +1,332 @@
+"""
+Gemini Model Helpers
+One-time API configuration, shared plain model, models bound to a fixed
+system instruction so each request only sends its variable part, an
+embedding-based cache for paraphrased queries, and a SQLite-backed result
+cache that survives restarts
+"""
+
+import os
+import math
+import json
+import asyncio
+import sqlite3
+import threading
+import time
+import logging
+import operator
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+logger = logging.getLogger("gemini_cache")
+
+MODEL_NAME = "gemini-2.0-flash"
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+# Default location of the persistent result cache
+DISK_CACHE_PATH = os.path.join(".cache", "agent_llm.db")
+
+
+_configured = False
+
+
+def configure_once():
+    """Load .env and configure the Gemini API key (first call only)"""
+    global _configured
+    if _configured:
+        return
+    load_dotenv()
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    _configured = True
+
+
+_shared_model = None
+
+
+def shared_model():
+    """
+    The plain GenerativeModel shared by every agent
+    Reusing one model reuses its client channel (and TLS session) across agents
+    """
+    global _shared_model
+    if _shared_model is None:
+        _shared_model = genai.GenerativeModel(MODEL_NAME)
+    return _shared_model
+
+
+class PrefixModel:
+    """
+    GenerativeModel bound to a fixed system instruction and generation config
+
+    The instruction is sent as system_instruction rather than inside every
+    prompt. Explicit CachedContent is not used: Gemini only caches contexts
+    of several thousand tokens, and every instruction in this project is
+    far below that, so creating one would always fail.
+    """
+
+    def __init__(
+        self,
+        system_instruction: str,
+        model_name: str = MODEL_NAME,
+        generation_config: Optional[Dict[str, Any]] = None
+    ):
+        self.system_instruction = system_instruction
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.model = genai.GenerativeModel(
+            model_name,
+            system_instruction=system_instruction,
+            generation_config=generation_config
+        )
+
+    def generate_content(self, *args, **kwargs):
+        """Same as GenerativeModel.generate_content"""
+        return self.model.generate_content(*args, **kwargs)
+
+    async def generate_content_async(self, *args, **kwargs):
+        """Same as GenerativeModel.generate_content_async"""
+        return await self.model.generate_content_async(*args, **kwargs)
+
+
+def json_output(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Generation config asking Gemini for JSON that matches `schema`"""
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": schema
+    }
+
+
+class SemanticCache:
+    """
+    Reuse results across paraphrased queries
+
+    Queries are embedded with a Gemini embedding model and compared by cosine
+    similarity against earlier queries in the same namespace (e.g. the same
+    customer context); a stored result is returned when the best match
+    reaches `threshold`. The cache is a bounded FIFO searched linearly, which
+    is fast enough at this size without a vector index.
+    """
+
+    def __init__(self, threshold: float = 0.95, maxsize: int = 256, model: str = EMBEDDING_MODEL):
+        self.threshold = threshold
+        self.model = model
+        self._entries = deque(maxlen=maxsize)  # (namespace, unit vector, result)
+        self.hits = 0
+        self.misses = 0
+
+    async def embed(self, text: str) -> Optional[List[float]]:
+        """Unit-length embedding of `text`, or None if the embedding call fails"""
+        try:
+            result = await genai.embed_content_async(model=self.model, content=text)
+        except Exception as e:
+            logger.debug("Embedding failed: %s", e)
+            return None
+        vector = result["embedding"]
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def lookup(self, namespace: str, vector: List[float]) -> Optional[Dict[str, Any]]:
+        """Most similar cached result at or above the threshold, if any"""
+        best, best_score = None, self.threshold
+        for entry_namespace, entry_vector, result in self._entries:
+            if entry_namespace != namespace:
+                continue
+            score = sum(map(operator.mul, vector, entry_vector))
+            if score >= best_score:
+                best, best_score = result, score
+
+        if best is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(best)
+
+    def add(self, namespace: str, vector: List[float], result: Dict[str, Any]):
+        self._entries.append((namespace, vector, dict(result)))
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+class DiskCache:
+    """
+    Persistent LRU cache of JSON results in a local SQLite file
+
+    Sits under an in-memory cache so repeated dev/test runs skip Gemini for
+    queries seen in earlier runs. Entries are stamped with a version tag;
+    bump it when the prompt or schema changes and older entries stop matching.
+    Entries expire after `ttl` seconds; once the table grows past `maxsize`,
+    expired and least recently used rows are evicted. Access times are only
+    rewritten when they are more than `touch_interval` seconds old, so most
+    hits are pure reads. get_async/put_async run the SQLite work in a worker
+    thread. Any SQLite error disables the cache instead of failing the request.
+    """
+
+    def __init__(
+        self,
+        path: str = DISK_CACHE_PATH,
+        version: str = "",
+        maxsize: int = 10000,
+        ttl: float = 7 * 24 * 3600.0,
+        touch_interval: float = 3600.0
+    ):
+        self.path = path
+        self.version = version
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._rows = 0
+        self._lock = threading.RLock()
+        self._disabled = False
+
+    def _connection(self):
+        if self._conn is None and not self._disabled:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute("PRAGMA synchronous = NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_results ("
+                    "key TEXT PRIMARY KEY, version TEXT NOT NULL, value TEXT NOT NULL, "
+                    "created REAL NOT NULL, accessed REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_results_accessed ON llm_results(accessed)")
+                self._rows = conn.execute("SELECT COUNT(*) FROM llm_results").fetchone()[0]
+                self._conn = conn
+            except (sqlite3.Error, OSError) as e:
+                logger.warning("Disk cache disabled (%s): %s", self.path, e)
+                self._disabled = True
+        return self._conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached value for key, or None (blocking; see get_async)"""
+        with self._lock:
+            conn = self._connection()
+            row = None
+            if conn is not None:
+                now = time.time()
+                try:
+                    row = conn.execute(
+                        "SELECT value, accessed FROM llm_results "
+                        "WHERE key = ? AND version = ? AND created > ?",
+                        (key, self.version, now - self.ttl)
+                    ).fetchone()
+                    if row is not None and now - row[1] > self.touch_interval:
+                        conn.execute("UPDATE llm_results SET accessed = ? WHERE key = ?", (now, key))
+                except sqlite3.Error as e:
+                    logger.debug("Disk cache read failed: %s", e)
+                    row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """Store value under key (blocking; see put_async)"""
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return
+            now = time.time()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_results (key, version, value, created, accessed) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, self.version, json.dumps(value), now, now)
+                )
+                # Upper bound (replacements also count); recounted before evicting
+                self._rows += 1
+                if self._rows > self.maxsize:
+                    self._evict(conn, now)
+            except sqlite3.Error as e:
+                logger.debug("Disk cache write failed: %s", e)
+
+    def _evict(self, conn, now: float):
+        self._rows = conn.execute("SELECT COUNT(*) FROM llm_results").fetchone()[0]
+        if self._rows <= self.maxsize:
+            return
+        conn.execute("DELETE FROM llm_results WHERE created <= ?", (now - self.ttl,))
+        conn.execute(
+            "DELETE FROM llm_results WHERE key IN ("
+            "SELECT key FROM llm_results ORDER BY accessed LIMIT max(0, "
+            "(SELECT COUNT(*) FROM llm_results) - ?))",
+            (self.maxsize,)
+        )
+        self._rows = conn.execute("SELECT COUNT(*) FROM llm_results").fetchone()[0]
+
+    async def get_async(self, key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def put_async(self, key: str, value: Dict[str, Any]):
+        await asyncio.to_thread(self.put, key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+class _LeaderCancelled(Exception):
+    """The caller running a shared call was cancelled before it finished"""
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one in-flight call
+
+    The first caller for a key runs the call; callers arriving while it is
+    pending await the same result (or exception) instead of starting their
+    own. Dict results are shallow-copied for the waiters. If the first
+    caller is cancelled, the waiters retry rather than fail with it.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                result = await asyncio.shield(pending)
+            except _LeaderCancelled:
+                return await self.do(key, call)
+            return dict(result) if isinstance(result, dict) else result
+
+        future = asyncio.get_running_loop().create_future()
+        # Waiters may all be gone by the time an error lands; don't warn about it
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    def __len__(self) -> int:
+        return len(self._inflight)
@@ -5,14 +5,33 @@ Tests all 5 required scenarios plus bonus scenario
 
 import asyncio
 import json
+import logging
+import os
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
 from data_agent import CustomerDataAgent
 from support_agent import SupportAgent
 from router_agent import RouterAgent
 from a2a_protocol import a2a_logger
 
 
+def to_pretty_json(obj) -> str:
+    """Pretty-print a result for the console (orjson when available)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(obj, indent=2, default=str)
+
+
 async def setup_system():
     """Initialize all agents and connect to MCP"""
     print("\n" + "="*60)
@@ -23,12 +42,17 @@ async def setup_system():
     data_agent = CustomerDataAgent("mcp_server.py")
     support_agent = SupportAgent("mcp_server.py")
     
-    # Connect to MCP
-    await data_agent.connect_mcp()
-    await support_agent.connect_mcp()
+    # Connect to MCP (independent, so connect both at once)
+    await asyncio.gather(data_agent.connect_mcp(), support_agent.connect_mcp())
     
-    # Initialize router
-    router = RouterAgent(data_agent, support_agent)
+    # Initialize router (A2A messages, so the run ends with the A2A summary).
+    # Escalation replies are printed as soon as they stream in.
+    router = RouterAgent(
+        data_agent,
+        support_agent,
+        wire_mode=True,
+        on_escalation_reply=lambda text: print(f"\n[ESCALATION REPLY] {text}")
+    )
     
     print("\n✓ All agents initialized and connected")
     
@@ -40,15 +64,8 @@ async def test_scenario_1(router):
     Scenario 1: Simple Query
     "Get customer information for ID 5"
     """
-    print("\n" + "="*60)
-    print("TEST SCENARIO 1: Simple Query")
-    print("="*60)
-    
     query = "Get customer information for ID 5"
-    result = await router.route_query(query, customer_id=5)
-    
-    print(f"\n[RESULT]")
-    print(json.dumps(result, indent=2, default=str))
+    return await router.route_query(query, customer_id=5)
 
 
 async def test_scenario_2(router):
@@ -56,15 +73,8 @@ async def test_scenario_2(router):
     Scenario 2: Coordinated Query
     "I'm customer 1 and need help upgrading my account"
     """
-    print("\n" + "="*60)
-    print("TEST SCENARIO 2: Coordinated Query")
-    print("="*60)
-    
     query = "I'm customer 1 and need help upgrading my account"
-    result = await router.route_query(query)
-    
-    print(f"\n[RESULT]")
-    print(json.dumps(result, indent=2, default=str))
+    return await router.route_query(query)
 
 
 async def test_scenario_3(router):
@@ -72,15 +82,8 @@ async def test_scenario_3(router):
     Scenario 3: Complex Query
     "Show me all active customers who have open tickets"
     """
-    print("\n" + "="*60)
-    print("TEST SCENARIO 3: Complex Query")
-    print("="*60)
-    
     query = "Show me all active customers who have open tickets"
-    result = await router.route_query(query)
-    
-    print(f"\n[RESULT]")
-    print(json.dumps(result, indent=2, default=str))
+    return await router.route_query(query)
 
 
 async def test_scenario_4(router):
@@ -88,15 +91,8 @@ async def test_scenario_4(router):
     Scenario 4: Escalation
     "I've been charged twice, please refund immediately!"
     """
-    print("\n" + "="*60)
-    print("TEST SCENARIO 4: Escalation")
-    print("="*60)
-    
     query = "I've been charged twice, please refund immediately!"
-    result = await router.route_query(query)
-    
-    print(f"\n[RESULT]")
-    print(json.dumps(result, indent=2, default=str))
+    return await router.route_query(query)
 
 
 async def test_scenario_5(router):
@@ -104,15 +100,8 @@ async def test_scenario_5(router):
     Scenario 5: Multi-Intent
     "Update my email to charlie.new@example.com and show my ticket history"
     """
-    print("\n" + "="*60)
-    print("TEST SCENARIO 5: Multi-Intent")
-    print("="*60)
-    
     query = "Update my email to charlie.new@example.com and show my ticket history"
-    result = await router.route_query(query, customer_id=5)  # Charlie Brown is ID 5
-    
-    print(f"\n[RESULT]")
-    print(json.dumps(result, indent=2, default=str))
+    return await router.route_query(query, customer_id=5)  # Charlie Brown is ID 5
 
 
 async def test_bonus_scenario(router):
@@ -120,15 +109,28 @@ async def test_bonus_scenario(router):
     Bonus Scenario: Complex Coordination
     "What are all the high-priority tickets currently open?"
     """
+    query = "What are all the high-priority tickets currently open?"
+    return await router.route_query(query)
+
+
+# Banner titles, in the order results are printed
+CONCURRENT_SCENARIOS = (
+    ("TEST SCENARIO 1: Simple Query", test_scenario_1),
+    ("TEST SCENARIO 2: Coordinated Query", test_scenario_2),
+    ("TEST SCENARIO 3: Complex Query", test_scenario_3),
+    ("TEST SCENARIO 4: Escalation", test_scenario_4),
+    ("BONUS SCENARIO: High Priority Tickets", test_bonus_scenario),
+)
+SCENARIO_5_TITLE = "TEST SCENARIO 5: Multi-Intent"
+
+
+def print_result(name: str, result) -> None:
+    """Print one scenario's result under its banner"""
     print("\n" + "="*60)
-    print("BONUS SCENARIO: High Priority Tickets")
+    print(name)
     print("="*60)
-    
-    query = "What are all the high-priority tickets currently open?"
-    result = await router.route_query(query)
-    
     print(f"\n[RESULT]")
-    print(json.dumps(result, indent=2, default=str))
+    print(to_pretty_json(result))
 
 
 async def cleanup_system(data_agent, support_agent):
@@ -137,8 +139,7 @@ async def cleanup_system(data_agent, support_agent):
     print("CLEANUP")
     print("="*60)
     
-    await data_agent.disconnect_mcp()
-    await support_agent.disconnect_mcp()
+    await asyncio.gather(data_agent.disconnect_mcp(), support_agent.disconnect_mcp())
     
     print("\n✓ All agents disconnected")
 
@@ -150,30 +151,30 @@ async def main():
     router, data_agent, support_agent = await setup_system()
     
     try:
-        # Run all scenarios
-        await test_scenario_1(router)
-        await asyncio.sleep(1)
+        # Read-only scenarios are independent, so run them concurrently and
+        # print the results afterwards in scenario order. A failing scenario
+        # is reported in place without cancelling the others.
+        outcomes = await asyncio.gather(
+            *(scenario(router) for _, scenario in CONCURRENT_SCENARIOS),
+            return_exceptions=True
+        )
+        for (title, _), outcome in zip(CONCURRENT_SCENARIOS, outcomes):
+            if isinstance(outcome, BaseException):
+                outcome = {"error": repr(outcome)}
+            print_result(title, outcome)
         
-        await test_scenario_2(router)
-        await asyncio.sleep(1)
-        
-        await test_scenario_3(router)
-        await asyncio.sleep(1)
-        
-        await test_scenario_4(router)
-        await asyncio.sleep(1)
-        
-        await test_scenario_5(router)
-        await asyncio.sleep(1)
-        
-        await test_bonus_scenario(router)
+        # Scenario 5 updates customer 5, which scenario 1 reads, so run it last
+        print_result(SCENARIO_5_TITLE, await test_scenario_5(router))
         
         # Show A2A communication summary
         print("\n" + "="*60)
         print("A2A COMMUNICATION SUMMARY")
         print("="*60)
         summary = a2a_logger.summary()
-        print(json.dumps(summary, indent=2))
+        print(to_pretty_json(summary))
+        print(f"Intent cache: {to_pretty_json(router.intent_cache.stats())}")
+        if router.disk_cache is not None:
+            print(f"Intent disk cache: {to_pretty_json(router.disk_cache.stats())}")
         
     finally:
         # Cleanup
@@ -185,11 +186,17 @@ async def main():
 
 
 if __name__ == "__main__":
+    # Agent traces are debug logs; LOG_LEVEL=DEBUG shows routing, INFO shows A2A traffic
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
+    
     # Verify database exists
     db_path = Path("support.db")
     if not db_path.exists():
         print("ERROR: support.db not found. Please run database_setup.py first.")
         exit(1)
     
-    # Run tests
-    asyncio.run(main())
+    # Run tests (on uvloop's faster event loop when installed)
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
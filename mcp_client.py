@@ -1,22 +1,19 @@
 """
-MCP Client - Simplified version that directly calls MCP server functions
+MCP Client - Simplified version that directly calls the database functions
+in-process (no stdio transport or JSON-RPC framing on the hot path)
 """
 
-import json
-from typing import Any, Dict
+import asyncio
+import logging
+from typing import Any, Dict, List
 import sys
 import os
 
-# Import MCP server functions directly
+# Import database functions directly (mcp_server wraps the same ones for stdio)
 sys.path.insert(0, os.path.dirname(__file__))
-from mcp_server import (
-    _get_customer,
-    _list_customers,
-    _update_customer,
-    _create_ticket,
-    _get_customer_history,
-    _get_tickets
-)
+from customer_db import _run_tool, acquire_db_connection, release_db_connection
+
+logger = logging.getLogger("mcp_client")
 
 
 class MCPClient:
@@ -32,18 +29,27 @@ class MCPClient:
             "update_customer",
             "create_ticket",
             "get_customer_history",
-            "get_tickets"
+            "get_tickets",
+            "query_active_with_open_tickets",
+            "batch_execute"
         ]
+        self._connected = False
     
     async def connect(self):
         """Connect to MCP server (simplified - just initialize)"""
-        print(f"[MCP Client] Connected to server")
-        print(f"[MCP Client] Available tools: {len(self.available_tools)}")
+        if not self._connected:
+            await asyncio.to_thread(acquire_db_connection)
+            self._connected = True
+        logger.debug("[MCP Client] Connected to server")
+        logger.debug("[MCP Client] Available tools: %d", len(self.available_tools))
     
     async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
         """
         Call an MCP tool by directly invoking the function
         
+        The blocking SQLite work runs in a worker thread so concurrent
+        agent calls don't stall the event loop.
+        
         Args:
             tool_name: Name of the tool to call
             arguments: Tool arguments
@@ -51,47 +57,12 @@ class MCPClient:
         Returns:
             Tool result
         """
+        return await asyncio.to_thread(self._call_tool_sync, tool_name, arguments)
+    
+    def _call_tool_sync(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
+        """Route a tool call to its database function (runs in a worker thread)"""
         try:
-            # Route to appropriate function
-            if tool_name == "get_customer":
-                result = _get_customer(arguments["customer_id"])
-            
-            elif tool_name == "list_customers":
-                result = _list_customers(
-                    status=arguments.get("status", "all"),
-                    limit=arguments.get("limit", 10)
-                )
-            
-            elif tool_name == "update_customer":
-                result = _update_customer(
-                    customer_id=arguments["customer_id"],
-                    name=arguments.get("name"),
-                    email=arguments.get("email"),
-                    phone=arguments.get("phone"),
-                    status=arguments.get("status")
-                )
-            
-            elif tool_name == "create_ticket":
-                result = _create_ticket(
-                    customer_id=arguments["customer_id"],
-                    issue=arguments["issue"],
-                    priority=arguments.get("priority", "medium")
-                )
-            
-            elif tool_name == "get_customer_history":
-                result = _get_customer_history(arguments["customer_id"])
-            
-            elif tool_name == "get_tickets":
-                result = _get_tickets(
-                    status=arguments.get("status", "all"),
-                    priority=arguments.get("priority", "all"),
-                    customer_ids=arguments.get("customer_ids")
-                )
-            
-            else:
-                result = {"error": f"Unknown tool: {tool_name}"}
-            
-            return result
+            return _run_tool(tool_name, arguments)
         
         except Exception as e:
             return {
@@ -100,10 +71,25 @@ class MCPClient:
                 "arguments": arguments
             }
     
+    async def call_batch(self, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Run several tool calls in one round-trip and one transaction
+        
+        Args:
+            operations: List of {"tool": name, "args": {...}} dicts
+            
+        Returns:
+            {"results": [...]} with one {ok, value|error} entry per operation
+        """
+        return await self.call_tool("batch_execute", {"operations": operations})
+    
     async def list_tools(self):
         """List available MCP tools"""
         return self.available_tools
     
     async def disconnect(self):
-        """Disconnect from MCP server"""
-        print("[MCP Client] Disconnected")
\ No newline at end of file
+        """Disconnect from MCP server (the shared connection closes with the last client)"""
+        if self._connected:
+            self._connected = False
+            await asyncio.to_thread(release_db_connection)
+        logger.debug("[MCP Client] Disconnected")
\ No newline at end of file
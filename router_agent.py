@@ -4,19 +4,181 @@ Uses Gemini AI to analyze queries and coordinate between specialist agents
 """
 
 import os
+import re
+import asyncio
 import json
-import google.generativeai as genai
-from typing import Dict, Any, Optional
-from dotenv import load_dotenv
+import time
+import logging
+from string import Template
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import orjson
+    _loads = orjson.loads  # orjson.JSONDecodeError subclasses json.JSONDecodeError
+except ImportError:
+    _loads = json.loads
 
 from a2a_protocol import A2AMessage, A2AResponse, a2a_logger
 from agent_cards import ROUTER_AGENT_CARD
+from gemini_cache import DISK_CACHE_PATH, DiskCache, PrefixModel, SingleFlight, configure_once, json_output, shared_model
+
+logger = logging.getLogger("router_agent")
+
+# Load .env and configure Gemini (once per process)
+configure_once()
+
+# Intent-analysis instructions, sent as the model's system instruction so
+# each prompt only carries the query and customer ID
+INTENT_PREFIX = """Analyze the customer service query below and determine how to route it.
+
+Respond with JSON:
+{
+    "type": "simple_data_retrieval | coordinated_support | complex_multi_agent | escalation | multi_intent",
+    "intents": ["list of intents like 'get_customer', 'update_email', 'create_ticket', etc"],
+    "requires_data_agent": true/false,
+    "requires_support_agent": true/false,
+    "customer_id_mentioned": integer or null,
+    "urgency": "low | medium | high",
+    "explanation": "Brief explanation of routing decision"
+}
+
+Query Types:
+- simple_data_retrieval: Direct data fetch (e.g., "Get customer 5", "Show customer info")
+- coordinated_support: Needs both data and support (e.g., "I need help with my account")
+- complex_multi_agent: Multiple operations (e.g., "Show all active customers with open tickets")
+- escalation: Urgent issues (e.g., "charged twice", "refund immediately")
+- multi_intent: Multiple actions (e.g., "Update email AND show history")
+
+Extract customer ID if mentioned (e.g., "customer 5", "ID 12345", "I'm customer 1")."""
+
+# Per-call intent prompt body (INTENT_PREFIX is the system instruction)
+_INTENT_TMPL = Template("Customer Query: $query\nCustomer ID: $customer_id")
+
+# Gemini structured-output schema for the intent analysis
+# Bump whenever INTENT_PREFIX, _INTENT_TMPL or INTENT_SCHEMA change so
+# analyses persisted by older versions are ignored
+INTENT_TEMPLATE_VERSION = "intent-v1"
+
+INTENT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "type": {
+            "type": "STRING",
+            "format": "enum",
+            "enum": ["simple_data_retrieval", "coordinated_support", "complex_multi_agent",
+                     "escalation", "multi_intent"]
+        },
+        "intents": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "requires_data_agent": {"type": "BOOLEAN"},
+        "requires_support_agent": {"type": "BOOLEAN"},
+        "customer_id_mentioned": {"type": "INTEGER", "nullable": True},
+        "urgency": {"type": "STRING", "format": "enum", "enum": ["low", "medium", "high"]},
+        "explanation": {"type": "STRING"}
+    },
+    "required": ["type", "intents", "requires_data_agent", "requires_support_agent",
+                 "customer_id_mentioned", "urgency", "explanation"]
+}
 
-# Load environment variables
-load_dotenv()
+# Keyword fast path for common query shapes, checked in order before asking
+# Gemini. Each entry: (pattern, type, intents, requires_data, requires_support, urgency)
+_FAST_INTENTS = [
+    # Only unambiguous billing emergencies; "refund policy?" etc. go to Gemini
+    (re.compile(r"\b(?:charged twice|double[- ]charged|refund\s+(?:me\s+)?immediately)\b", re.I),
+     "escalation", ["refund_request"], False, True, "high"),
+    (re.compile(r"\bupdate\b.*\bemail\b.*\band\b.*\b(?:history|tickets?)\b", re.I),
+     "multi_intent", ["update_email", "get_history"], True, False, "low"),
+    (re.compile(r"\bactive customers\b.*\bopen tickets\b", re.I),
+     "complex_multi_agent", ["list_customers", "get_tickets"], True, True, "low"),
+    (re.compile(r"\b(?:i'?m|i am) customer\s+\d+\b.*\bhelp\b", re.I),
+     "coordinated_support", ["get_customer", "support_query"], True, True, "medium"),
+    # "Get customer 5", "show customer #12", "Get customer information for ID 5"
+    (re.compile(r"^\s*(?:get|show|fetch)\s+customer(?:\s+(?:info(?:rmation)?|details|record))?"
+                r"(?:\s+for)?(?:\s+(?:customer|id))?\s*#?\d+\s*[.?!]?\s*$", re.I),
+     "simple_data_retrieval", ["get_customer"], True, False, "low"),
+]
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+_CUSTOMER_ID_RE = re.compile(r"\b(?:customer|id)\s*#?(\d+)\b", re.I)
+
+# Values an update intent needs pulled out of the query text:
+# intent -> (customer field, description for the extraction prompt)
+_EXTRACT_FIELDS = {
+    "update_email": ("email", "the new email address"),
+    "update_phone": ("phone", "the new phone number"),
+    "update_name": ("name", "the new customer name"),
+}
+_MAX_EXTRACT_FIELDS = 8
+
+
+def _fast_intent(query: str, customer_id: Optional[int]) -> Optional[Dict[str, Any]]:
+    """Classify a query by keyword patterns; None means ask Gemini"""
+    for pattern, query_type, intents, needs_data, needs_support, urgency in _FAST_INTENTS:
+        if pattern.search(query):
+            if customer_id is None:
+                match = _CUSTOMER_ID_RE.search(query)
+                customer_id = int(match.group(1)) if match else None
+            return {
+                "type": query_type,
+                "intents": list(intents),
+                "requires_data_agent": needs_data,
+                "requires_support_agent": needs_support,
+                "customer_id_mentioned": customer_id,
+                "urgency": urgency,
+                "explanation": "Matched keyword fast path"
+            }
+    return None
+
+
+class _IntentCache:
+    """
+    LRU cache of parsed intent analyses with a TTL
+    Keyed by customer ID plus the normalized (lowercased, whitespace-collapsed) query
+    """
+    
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(query: str, customer_id: Optional[int]) -> str:
+        normalized = " ".join(query.lower().split())
+        return hashlib.sha1(f"{customer_id}|{normalized}".encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, value = entry
+            if time.monotonic() - stored_at < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(value)
+            del self._entries[key]
+        self.misses += 1
+        return None
+    
+    def put(self, key: str, value: Dict[str, Any]):
+        self._entries[key] = (time.monotonic(), dict(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+    
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
 
 
 class RouterAgent:
@@ -25,23 +187,78 @@ class RouterAgent:
     Uses Gemini AI for intelligent routing decisions
     """
     
-    def __init__(self, data_agent, support_agent):
+    def __init__(
+        self,
+        data_agent,
+        support_agent,
+        wire_mode: Optional[bool] = None,
+        on_escalation_reply: Optional[Callable[[str], Any]] = None
+    ):
         """
         Initialize Router Agent
         
         Args:
             data_agent: CustomerDataAgent instance
             support_agent: SupportAgent instance
+            wire_mode: Send A2A messages (logged) instead of calling the
+                in-process agents directly; defaults to the A2A_WIRE_MODE env var
+            on_escalation_reply: Called with the customer-facing reply of an
+                escalation as soon as it has streamed in, before the rest of
+                the escalation result is ready
         """
         self.agent_id = "router_agent"
         self.agent_card = ROUTER_AGENT_CARD
         self.data_agent = data_agent
         self.support_agent = support_agent
         
+        if wire_mode is None:
+            wire_mode = os.getenv("A2A_WIRE_MODE", "").lower() in ("1", "true", "yes")
+        self.wire_mode = wire_mode
+        self.on_escalation_reply = on_escalation_reply
+        
+        # Direct (same-process) method tables: agent -> A2A method -> coroutine
+        self._direct = {
+            "data_agent": {
+                "get_customer": data_agent.get_customer,
+                "get_customer_full": data_agent.get_customer_full,
+                "update_customer": data_agent.update_customer,
+                "get_customer_history": data_agent.get_customer_history,
+                "query_active_with_open_tickets": data_agent.query_active_with_open_tickets,
+            },
+            "support_agent": {
+                "handle_support_query": support_agent.handle_support_query,
+                "analyze_urgency": support_agent.analyze_urgency,
+            },
+        }
+        self._agents = {"data_agent": data_agent, "support_agent": support_agent}
+        
+        # Query type (from intent analysis) -> handler
+        self._handlers = {
+            "simple_data_retrieval": self._handle_simple_query,
+            "coordinated_support": self._handle_coordinated_query,
+            "complex_multi_agent": self._handle_complex_query,
+            "escalation": self._handle_escalation,
+            "multi_intent": self._handle_multi_intent,
+        }
+        
         # Initialize Gemini
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.model = shared_model()
+        self.intent_model = PrefixModel(INTENT_PREFIX, generation_config=json_output(INTENT_SCHEMA))
+        
+        # Parsed Gemini intent analyses, reused for repeated queries
+        self.intent_cache = _IntentCache()
+        # ...and, opt-in (AGENT_DISK_CACHE=1), persisted across runs
+        if os.getenv("AGENT_DISK_CACHE", "").lower() in ("1", "true", "yes"):
+            self.disk_cache = DiskCache(
+                os.getenv("AGENT_CACHE_PATH", DISK_CACHE_PATH),
+                version=f"{INTENT_TEMPLATE_VERSION}|{self.intent_model.model_name}",
+                ttl=float(os.getenv("AGENT_CACHE_TTL", 7 * 24 * 3600))
+            )
+        else:
+            self.disk_cache = None
+        self._inflight = SingleFlight()
         
-        print(f"[{self.agent_id}] Initialized with Gemini AI")
+        logger.debug("[%s] Initialized with Gemini AI", self.agent_id)
     
     async def route_query(self, query: str, customer_id: Optional[int] = None) -> Dict[str, Any]:
         """
@@ -54,42 +271,29 @@ class RouterAgent:
         Returns:
             Complete response with routing details
         """
-        print(f"\n{'='*60}")
-        print(f"[{self.agent_id}] Routing query: {query}")
-        print(f"{'='*60}")
+        logger.debug("[%s] Routing query: %s", self.agent_id, query)
         
-        # Step 1: Analyze query intent using Gemini
+        # Step 1: Analyze query intent (keyword rules, then Gemini)
         intent_analysis = await self._analyze_intent(query, customer_id)
         
-        print(f"\n[{self.agent_id}] Intent Analysis:")
-        print(f"  Type: {intent_analysis.get('type')}")
-        print(f"  Requires Data Agent: {intent_analysis.get('requires_data_agent')}")
-        print(f"  Requires Support Agent: {intent_analysis.get('requires_support_agent')}")
+        logger.debug(
+            "[%s] Intent Analysis: type=%s, requires_data_agent=%s, requires_support_agent=%s",
+            self.agent_id,
+            intent_analysis.get('type'),
+            intent_analysis.get('requires_data_agent'),
+            intent_analysis.get('requires_support_agent')
+        )
         
         # Step 2: Route based on intent
         query_type = intent_analysis.get("type")
         
-        if query_type == "simple_data_retrieval":
-            result = await self._handle_simple_query(query, customer_id, intent_analysis)
-        
-        elif query_type == "coordinated_support":
-            result = await self._handle_coordinated_query(query, customer_id, intent_analysis)
-        
-        elif query_type == "complex_multi_agent":
-            result = await self._handle_complex_query(query, customer_id, intent_analysis)
-        
-        elif query_type == "escalation":
-            result = await self._handle_escalation(query, customer_id, intent_analysis)
-        
-        elif query_type == "multi_intent":
-            result = await self._handle_multi_intent(query, customer_id, intent_analysis)
-        
+        handler = self._handlers.get(query_type)
+        if handler is not None:
+            result = await handler(query, customer_id, intent_analysis)
         else:
             result = {"error": f"Unknown query type: {query_type}"}
         
-        print(f"\n{'='*60}")
-        print(f"[{self.agent_id}] Query completed")
-        print(f"{'='*60}\n")
+        logger.debug("[%s] Query completed", self.agent_id)
         
         return result
     
@@ -104,44 +308,57 @@ class RouterAgent:
         Returns:
             Intent analysis
         """
-        print(f"[{self.agent_id}] Analyzing intent with Gemini AI...")
-        
-        prompt = f"""Analyze this customer service query and determine how to route it.
-
-Customer Query: {query}
-Customer ID: {customer_id if customer_id else "Not provided"}
-
-Analyze the query and respond with JSON:
-{{
-    "type": "simple_data_retrieval | coordinated_support | complex_multi_agent | escalation | multi_intent",
-    "intents": ["list of intents like 'get_customer', 'update_email', 'create_ticket', etc"],
-    "requires_data_agent": true/false,
-    "requires_support_agent": true/false,
-    "customer_id_mentioned": integer or null,
-    "urgency": "low | medium | high",
-    "explanation": "Brief explanation of routing decision"
-}}
-
-Query Types:
-- simple_data_retrieval: Direct data fetch (e.g., "Get customer 5", "Show customer info")
-- coordinated_support: Needs both data and support (e.g., "I need help with my account")
-- complex_multi_agent: Multiple operations (e.g., "Show all active customers with open tickets")
-- escalation: Urgent issues (e.g., "charged twice", "refund immediately")
-- multi_intent: Multiple actions (e.g., "Update email AND show history")
-
-Extract customer ID if mentioned (e.g., "customer 5", "ID 12345", "I'm customer 1")."""
+        # Deterministic rules first; Gemini only when none of them fires
+        fast = _fast_intent(query, customer_id)
+        if fast is not None:
+            logger.debug("[%s] Intent matched keyword rules", self.agent_id)
+            return fast
+        
+        cache_key = self.intent_cache.key(query, customer_id)
+        cached = self.intent_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("[%s] Intent analysis served from cache", self.agent_id)
+            return cached
+        
+        if self.disk_cache is not None:
+            cached = await self.disk_cache.get_async(cache_key)
+            if cached is not None:
+                logger.debug("[%s] Intent analysis served from disk cache", self.agent_id)
+                self.intent_cache.put(cache_key, cached)
+                return cached
+        
+        # Identical queries arriving together share one Gemini call
+        return await self._inflight.do(
+            cache_key, lambda: self._gemini_intent(query, customer_id, cache_key)
+        )
+    
+    async def _gemini_intent(self, query: str, customer_id: Optional[int], cache_key: str) -> Dict[str, Any]:
+        """Ask Gemini for the intent analysis and cache it"""
+        logger.debug("[%s] Analyzing intent with Gemini AI...", self.agent_id)
+        
+        # Instructions come from the system instruction
+        prompt = _INTENT_TMPL.substitute(
+            query=query,
+            customer_id=customer_id if customer_id else "Not provided"
+        )
         
-        response = self.model.generate_content(prompt)
-
-        response_text = response.text.strip()
+        response = await self.intent_model.generate_content_async(prompt)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            logger.debug("[%s] Cached prompt tokens: %s", self.agent_id,
+                         getattr(usage, "cached_content_token_count", 0))
 
-        response_text = response_text.replace('```json', '').replace('```', '').strip()
+        response_text = response.text
 
         try:
-            result = json.loads(response_text)
+            result = _loads(response_text)
+            self.intent_cache.put(cache_key, result)
+            if self.disk_cache is not None:
+                await self.disk_cache.put_async(cache_key, result)
         except json.JSONDecodeError as e:
-            print(f"[{self.agent_id}] ⚠️  Failed to parse JSON, using fallback")
-            print(f"Response: {response_text[:200]}...")
+            logger.warning("[%s] Failed to parse intent JSON, using fallback", self.agent_id)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Response: %s...", response_text[:200])
             # Fallback
             result = {
                 "type": "simple_data_retrieval",
@@ -155,6 +372,36 @@ Extract customer ID if mentioned (e.g., "customer 5", "ID 12345", "I'm customer
                 
         return result
     
+    async def _send(self, to_agent: str, method: str, params: Dict[str, Any]) -> Any:
+        """
+        Invoke a specialist agent method and return its result
+        
+        In-process agents are called directly; with wire_mode the call goes
+        through an A2A message/response round-trip (and the A2A logger).
+        Either way a failing agent call comes back as {"error": message}
+        """
+        if not self.wire_mode:
+            return await self._call_direct(to_agent, method, params)
+        
+        message = A2AMessage(
+            method=method,
+            params=params,
+            from_agent=self.agent_id,
+            to_agent=to_agent
+        )
+        response = await self._agents[to_agent].handle_message(message)
+        if response.error:
+            return {"error": response.error.get("message")}
+        return response.result
+    
+    async def _call_direct(self, to_agent: str, method: str, params: Dict[str, Any]) -> Any:
+        """Call an in-process agent method, turning a failure into {"error": message}"""
+        try:
+            return await self._direct[to_agent][method](**params)
+        except Exception as e:
+            logger.warning("[%s] %s.%s failed: %s", self.agent_id, to_agent, method, e)
+            return {"error": str(e)}
+    
     async def _handle_simple_query(
         self,
         query: str,
@@ -162,7 +409,7 @@ Extract customer ID if mentioned (e.g., "customer 5", "ID 12345", "I'm customer
         intent_analysis: Dict
     ) -> Dict[str, Any]:
         """Handle simple data retrieval query"""
-        print(f"[{self.agent_id}] Handling SIMPLE QUERY")
+        logger.debug("[%s] Handling SIMPLE QUERY", self.agent_id)
         
         # Extract customer ID from analysis if not provided
         if not customer_id:
@@ -171,18 +418,8 @@ Extract customer ID if mentioned (e.g., "customer 5", "ID 12345", "I'm customer
         if not customer_id:
             return {"error": "Customer ID required but not provided"}
         
-        # Create A2A message to data agent
-        message = A2AMessage(
-            method="get_customer",
-            params={"customer_id": customer_id},
-            from_agent=self.agent_id,
-            to_agent="data_agent"
-        )
-        
         # Send to data agent
-        response = await self.data_agent.handle_message(message)
-        
-        return response.result
+        return await self._send("data_agent", "get_customer", {"customer_id": customer_id})
     
     async def _handle_coordinated_query(
         self,
@@ -191,39 +428,31 @@ Extract customer ID if mentioned (e.g., "customer 5", "ID 12345", "I'm customer
         intent_analysis: Dict
     ) -> Dict[str, Any]:
         """Handle coordinated query requiring both data and support agents"""
-        print(f"[{self.agent_id}] Handling COORDINATED QUERY")
+        logger.debug("[%s] Handling COORDINATED QUERY", self.agent_id)
         
         # Extract customer ID
         if not customer_id:
             customer_id = intent_analysis.get("customer_id_mentioned")
         
-        # Step 1: Get customer context from data agent
+        # Step 1: Get customer record and ticket history from the data agent
+        # (one batched MCP call)
         customer_context = None
+        ticket_context = None
         if customer_id:
-            data_message = A2AMessage(
-                method="get_customer",
-                params={"customer_id": customer_id},
-                from_agent=self.agent_id,
-                to_agent="data_agent"
-            )
-            data_response = await self.data_agent.handle_message(data_message)
-            customer_context = data_response.result.get("customer")
+            data_result = await self._send("data_agent", "get_customer_full", {"customer_id": customer_id})
+            customer_context = (data_result.get("customer") or {}).get("customer")
+            ticket_context = (data_result.get("history") or {}).get("tickets")
         
         # Step 2: Send to support agent with context
-        support_message = A2AMessage(
-            method="handle_support_query",
-            params={
-                "query": query,
-                "customer_context": customer_context
-            },
-            from_agent=self.agent_id,
-            to_agent="support_agent"
-        )
-        support_response = await self.support_agent.handle_message(support_message)
+        support_result = await self._send("support_agent", "handle_support_query", {
+            "query": query,
+            "customer_context": customer_context,
+            "ticket_context": ticket_context
+        })
         
         return {
             "customer_context": customer_context,
-            "support_response": support_response.result
+            "support_response": support_result
         }
     
     async def _handle_complex_query(
@@ -233,42 +462,25 @@ Extract customer ID if mentioned (e.g., "customer 5", "ID 12345", "I'm customer
         intent_analysis: Dict
     ) -> Dict[str, Any]:
         """Handle complex multi-agent query"""
-        print(f"[{self.agent_id}] Handling COMPLEX MULTI-AGENT QUERY")
+        logger.debug("[%s] Handling COMPLEX MULTI-AGENT QUERY", self.agent_id)
         
         # Example: "Show all active customers with open tickets"
+        # One JOIN on the data agent instead of list_customers + get_tickets
+        result = await self._send("data_agent", "query_active_with_open_tickets", {"limit": 50}) or {}
         
-        # Step 1: Get active customers
-        data_message1 = A2AMessage(
-            method="list_customers",
-            params={"status": "active", "limit": 50},
-            from_agent=self.agent_id,
-            to_agent="data_agent"
-        )
-        data_response1 = await self.data_agent.handle_message(data_message1)
-        customers = data_response1.result.get("customers", [])
+        # Tool/DB failures are reported as-is, not as an empty result
+        if "error" in result:
+            return result
         
-        # Step 2: Get their IDs
-        customer_ids = [c["id"] for c in customers]
+        active_count = result.get("active_customers_count", 0)
         
-        if not customer_ids:
+        if not active_count:
             return {"message": "No active customers found"}
         
-        # Step 3: Get open tickets for these customers
-        support_message = A2AMessage(
-            method="get_tickets",
-            params={
-                "status": "open",
-                "customer_ids": customer_ids
-            },
-            from_agent=self.agent_id,
-            to_agent="support_agent"
-        )
-        support_response = await self.support_agent.handle_message(support_message)
-        
         return {
-            "active_customers_count": len(customers),
-            "open_tickets": support_response.result.get("tickets", []),
-            "summary": f"Found {len(customers)} active customers with {support_response.result.get('count', 0)} open tickets"
+            "active_customers_count": active_count,
+            "open_tickets": result.get("tickets", []),
+            "summary": f"Found {active_count} active customers with {result.get('count', 0)} open tickets"
         }
     
     async def _handle_escalation(
@@ -278,33 +490,32 @@ Extract customer ID if mentioned (e.g., "customer 5", "ID 12345", "I'm customer
         intent_analysis: Dict
     ) -> Dict[str, Any]:
         """Handle urgent escalation"""
-        print(f"[{self.agent_id}] Handling ESCALATION (Urgent)")
+        logger.debug("[%s] Handling ESCALATION (Urgent)", self.agent_id)
         
-        # Analyze urgency
-        urgency_message = A2AMessage(
-            method="analyze_urgency",
-            params={"query": query},
-            from_agent=self.agent_id,
-            to_agent="support_agent"
-        )
-        urgency_response = await self.support_agent.handle_message(urgency_message)
-        urgency_analysis = urgency_response.result
-        
-        # Generate response with escalation flag
-        support_message = A2AMessage(
-            method="handle_support_query",
-            params={
-                "query": query,
-                "customer_context": {"escalation": True, "urgency": urgency_analysis}
-            },
-            from_agent=self.agent_id,
-            to_agent="support_agent"
+        # Urgency analysis and the support reply are independent Gemini calls,
+        # so run them concurrently; the reply gets the router's urgency estimate
+        support_params = {
+            "query": query,
+            "customer_context": {"escalation": True, "urgency": intent_analysis.get("urgency", "high")}
+        }
+        if self.on_escalation_reply is not None:
+            # Stream the reply to the callback; a callback can't travel in an
+            # A2A message, so this call is always made directly
+            support_call = self._call_direct(
+                "support_agent", "handle_support_query",
+                dict(support_params, on_response=self.on_escalation_reply)
+            )
+        else:
+            support_call = self._send("support_agent", "handle_support_query", support_params)
+        
+        urgency_analysis, support_result = await asyncio.gather(
+            self._send("support_agent", "analyze_urgency", {"query": query}),
+            support_call
         )
-        support_response = await self.support_agent.handle_message(support_message)
         
         return {
             "urgency_analysis": urgency_analysis,
-            "support_response": support_response.result,
+            "support_response": support_result,
             "escalated": True
         }
     
@@ -315,7 +526,7 @@ Extract customer ID if mentioned (e.g., "customer 5", "ID 12345", "I'm customer
         intent_analysis: Dict
     ) -> Dict[str, Any]:
         """Handle query with multiple intents"""
-        print(f"[{self.agent_id}] Handling MULTI-INTENT QUERY")
+        logger.debug("[%s] Handling MULTI-INTENT QUERY", self.agent_id)
         
         intents = intent_analysis.get("intents", [])
         results = {}
@@ -324,36 +535,67 @@ Extract customer ID if mentioned (e.g., "customer 5", "ID 12345", "I'm customer
         if not customer_id:
             customer_id = intent_analysis.get("customer_id_mentioned")
         
+        # One Gemini call pulls out every value the update intents need
+        extracted = await self._extract_fields(query, intents)
+        
         # Process each intent
         for intent in intents:
-            if intent == "update_email":
-                # Extract email using Gemini
-                extract_prompt = f"Extract the email address from: {query}. Respond with only the email address."
-                email_response = self.model.generate_content(extract_prompt)
-                email = email_response.text.strip()
+            if intent in _EXTRACT_FIELDS:
+                field = _EXTRACT_FIELDS[intent][0]
+                value = extracted.get(field)
+                if not value:
+                    results[f"{field}_update"] = {"error": f"No {field} found in query"}
+                    continue
                 
                 # Update via data agent
-                message = A2AMessage(
-                    method="update_customer",
-                    params={"customer_id": customer_id, "email": email},
-                    from_agent=self.agent_id,
-                    to_agent="data_agent"
+                results[f"{field}_update"] = await self._send(
+                    "data_agent", "update_customer", {"customer_id": customer_id, field: value}
                 )
-                response = await self.data_agent.handle_message(message)
-                results["email_update"] = response.result
             
             elif "history" in intent or "ticket" in intent:
-            # Get history via data agent
-                message = A2AMessage(
-                    method="get_customer_history",
-                    params={"customer_id": customer_id},
-                    from_agent=self.agent_id,
-                    to_agent="data_agent"
+                # Get history via data agent
+                results["ticket_history"] = await self._send(
+                    "data_agent", "get_customer_history", {"customer_id": customer_id}
                 )
-                response = await self.data_agent.handle_message(message)
-                results["ticket_history"] = response.result
         
         return {
             "intents_processed": intents,
             "results": results
         }
+    
+    async def _extract_fields(self, query: str, intents: list) -> Dict[str, Any]:
+        """
+        Extract the values for all update intents with a single Gemini call
+        
+        Args:
+            query: Customer query
+            intents: Intents from the intent analysis
+            
+        Returns:
+            Dict of field name -> extracted value (null when not found)
+        """
+        fields = [_EXTRACT_FIELDS[i] for i in dict.fromkeys(intents) if i in _EXTRACT_FIELDS]
+        if not fields:
+            return {}
+        
+        # Keep the batch small so extraction accuracy holds up
+        fields = fields[:_MAX_EXTRACT_FIELDS]
+        schema = ", ".join(f'"{name}": {desc} or null' for name, desc in fields)
+        prompt = f"""Extract the following fields from the query. Respond with only JSON: {{{schema}}}
+
+Query: {query}"""
+        
+        response = await self.model.generate_content_async(
+            prompt,
+            generation_config={"response_mime_type": "application/json"}
+        )
+        
+        try:
+            extracted = _loads(response.text)
+        except json.JSONDecodeError:
+            extracted = None
+        
+        if not isinstance(extracted, dict):
+            logger.warning("[%s] Failed to parse extracted fields", self.agent_id)
+            return {}
+        return extracted
@@ -4,21 +4,200 @@ Uses Gemini AI to generate customer support responses
 Accesses ticket data via MCP
 """
 
-import os
+import re
 import json
-import google.generativeai as genai
-from typing import Dict, Any, Optional
-from dotenv import load_dotenv
+import hashlib
+import logging
+from string import Template
+from typing import Dict, Any, Callable, Optional
+
+try:
+    import jiter  # partial JSON parsing for streamed replies
+except ImportError:
+    jiter = None
+
+try:
+    import orjson
+    _loads = orjson.loads
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_INDENT_2).decode()
+
+    def _dumps_compact(obj) -> str:
+        return orjson.dumps(obj, default=str).decode()
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj) -> str:
+        return json.dumps(obj, indent=2, default=str)
+
+    def _dumps_compact(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"), default=str)
 
 from a2a_protocol import A2AMessage, A2AResponse, a2a_logger
 from agent_cards import SUPPORT_AGENT_CARD
 from mcp_client import MCPClient
+from gemini_cache import PrefixModel, SemanticCache, SingleFlight, configure_once, json_output
+
+logger = logging.getLogger("support_agent")
+
+# Load .env and configure Gemini (once per process)
+configure_once()
+
+# Prompt instructions, each sent as a model's system instruction so
+# requests only carry the per-call query and context
+SUPPORT_PREFIX = """You are a professional customer support agent. Analyze the customer query below, using the customer context and previous tickets provided, and give a helpful response.
+
+Respond with JSON containing:
+{
+    "response": "Your professional customer-facing response",
+    "query_type": "general_inquiry | technical_support | billing_question | cancellation_refund | feature_request | account_issue",
+    "priority": "low | medium | high",
+    "requires_escalation": true/false,
+    "recommended_action": "What should be done next",
+    "internal_notes": "Notes for support team"
+}
 
-# Load environment variables
-load_dotenv()
+Be professional, empathetic, and helpful. Provide actionable solutions."""
+
+URGENCY_PREFIX = """Analyze the urgency of the customer support query below.
+
+Respond with JSON:
+{
+    "priority": "low | medium | high",
+    "is_urgent": true/false,
+    "urgency_factors": ["factor1", "factor2"],
+    "recommended_response_time": "immediate | within 1 hour | within 24 hours | within 3 days",
+    "explanation": "Why this priority level"
+}
+
+Consider factors like:
+- Words indicating urgency (immediately, urgent, critical, emergency)
+- Financial impact (charged twice, billing error, refund)
+- Service disruption (cannot access, not working, down)
+- Security concerns (hacked, unauthorized access)"""
+
+RESPONSE_PREFIX = """Generate a professional customer support response to the query below.
+
+Provide a warm, professional, and helpful response. Address the customer's concerns directly and offer clear next steps if applicable.
+
+Respond with JSON:
+{
+    "response": "Your customer-facing response"
+}"""
+
+
+# Per-call prompt bodies (the instructions above are the system instructions)
+_URGENCY_TMPL = Template("Query: $query")
+_RESPONSE_TMPL = Template("Query: $query\n\nContext: $context")
+
+# Gemini structured-output schemas for the prompts above
+SUPPORT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "response": {"type": "STRING"},
+        "query_type": {
+            "type": "STRING",
+            "format": "enum",
+            "enum": ["general_inquiry", "technical_support", "billing_question",
+                     "cancellation_refund", "feature_request", "account_issue"]
+        },
+        "priority": {"type": "STRING", "format": "enum", "enum": ["low", "medium", "high"]},
+        "requires_escalation": {"type": "BOOLEAN"},
+        "recommended_action": {"type": "STRING"},
+        "internal_notes": {"type": "STRING"}
+    },
+    "required": ["response", "query_type", "priority", "requires_escalation",
+                 "recommended_action", "internal_notes"]
+}
+
+URGENCY_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "priority": {"type": "STRING", "format": "enum", "enum": ["low", "medium", "high"]},
+        "is_urgent": {"type": "BOOLEAN"},
+        "urgency_factors": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "recommended_response_time": {
+            "type": "STRING",
+            "format": "enum",
+            "enum": ["immediate", "within 1 hour", "within 24 hours", "within 3 days"]
+        },
+        "explanation": {"type": "STRING"}
+    },
+    "required": ["priority", "is_urgent", "urgency_factors",
+                 "recommended_response_time", "explanation"]
+}
+
+RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "response": {"type": "STRING"}
+    },
+    "required": ["response"]
+}
+
+
+# Ticket fields worth sending to Gemini as context
+_TICKET_FIELDS = ("id", "issue", "status", "priority", "created_at")
+
+
+def _compact_ticket(ticket: Dict[str, Any]) -> Dict[str, Any]:
+    """Project a ticket onto the fields the support prompt needs"""
+    return {k: ticket.get(k) for k in _TICKET_FIELDS}
+
+
+# Local urgency classifier: the factors listed in URGENCY_PREFIX as weighted
+# keyword rules. Each entry: (pattern, factor, weight)
+_URGENCY_RULES = [
+    (re.compile(r"\b(?:hacked|unauthori[sz]ed access|breach|stolen|fraud)\b", re.I),
+     "Security concern", 4),
+    (re.compile(r"\b(?:charged twice|double[- ]charged|overcharged|billing error|refund)\b", re.I),
+     "Financial impact", 2),
+    (re.compile(r"\b(?:immediately|urgent(?:ly)?|asap|critical|emergency)\b", re.I),
+     "Urgent language", 2),
+    (re.compile(r"\b(?:(?:cannot|can'?t) (?:access|log ?in|sign in)|not working|outage|locked out|is down)\b", re.I),
+     "Service disruption", 1),
+]
+
+
+def _classify_urgency(query: str) -> Optional[Dict[str, Any]]:
+    """
+    Score a query against the urgency rules
+    Returns None when no rule fires (too little signal to decide locally)
+    """
+    factors = []
+    score = 0
+    for pattern, factor, weight in _URGENCY_RULES:
+        if pattern.search(query):
+            factors.append(factor)
+            score += weight
+    
+    if not factors:
+        return None
+    
+    if score >= 3:
+        priority = "high"
+        response_time = "immediate" if score >= 4 else "within 1 hour"
+    else:
+        priority = "medium"
+        response_time = "within 24 hours"
+    
+    return {
+        "priority": priority,
+        "is_urgent": priority == "high",
+        "urgency_factors": factors,
+        "recommended_response_time": response_time,
+        "explanation": f"Local classifier (score {score}): {', '.join(factors)}"
+    }
+
+
+def _log_cache_usage(agent_id: str, response):
+    """Log how many prompt tokens Gemini served from its context cache"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        logger.debug("[%s] Cached prompt tokens: %s", agent_id,
+                     getattr(usage, "cached_content_token_count", 0))
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 
 class SupportAgent:
@@ -39,16 +218,22 @@ class SupportAgent:
         self.mcp_server_path = mcp_server_path
         self.mcp_client: Optional[MCPClient] = None
         
-        # Initialize Gemini
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        # Initialize Gemini (one system instruction per prompt)
+        self.support_model = PrefixModel(SUPPORT_PREFIX, generation_config=json_output(SUPPORT_SCHEMA))
+        self.urgency_model = PrefixModel(URGENCY_PREFIX, generation_config=json_output(URGENCY_SCHEMA))
+        self.response_model = PrefixModel(RESPONSE_PREFIX, generation_config=json_output(RESPONSE_SCHEMA))
+        
+        # Embedding-similarity cache of support responses
+        self.response_cache = SemanticCache()
+        self._inflight = SingleFlight()
         
-        print(f"[{self.agent_id}] Initialized with Gemini AI")
+        logger.debug("[%s] Initialized with Gemini AI", self.agent_id)
     
     async def connect_mcp(self):
         """Connect to MCP server"""
         self.mcp_client = MCPClient(self.mcp_server_path)
         await self.mcp_client.connect()
-        print(f"[{self.agent_id}] Connected to MCP server")
+        logger.debug("[%s] Connected to MCP server", self.agent_id)
     
     async def handle_message(self, message: A2AMessage) -> A2AResponse:
         """
@@ -114,7 +299,8 @@ class SupportAgent:
         self,
         query: str,
         customer_context: Optional[Dict] = None,
-        ticket_context: Optional[list] = None
+        ticket_context: Optional[list] = None,
+        on_response: Optional[Callable[[str], Any]] = None
     ) -> Dict[str, Any]:
         """
         Handle a complete support query using Gemini AI
@@ -123,55 +309,114 @@ class SupportAgent:
             query: Customer query
             customer_context: Customer information
             ticket_context: Previous tickets
+            on_response: Optional callback given the customer-facing "response"
+                text as soon as it is complete, while the remaining fields are
+                still streaming (requires jiter; otherwise called at the end)
             
         Returns:
             Support response with analysis
         """
-        print(f"[{self.agent_id}] Handling support query with Gemini AI")
+        logger.debug("[%s] Handling support query with Gemini AI", self.agent_id)
         
-        # Build context for Gemini
-        context_str = "Customer Context:\n"
+        # Build context for Gemini as segments and join once
+        parts = ["Customer Context:\n"]
         if customer_context:
-            context_str += json.dumps(customer_context, indent=2)
+            parts.append(_dumps(customer_context))
         else:
-            context_str += "No customer context available"
+            parts.append("No customer context available")
         
         if ticket_context:
-            context_str += f"\n\nPrevious Tickets ({len(ticket_context)}):\n"
-            context_str += json.dumps(ticket_context[:3], indent=2)  # Show top 3
+            parts.append(f"\n\nPrevious Tickets ({len(ticket_context)}):\n")
+            parts.append(_dumps_compact([_compact_ticket(t) for t in ticket_context[:3]]))  # Show top 3
         
-        # Gemini prompt
-        prompt = f"""You are a professional customer support agent. Analyze this query and provide a helpful response.
-
-{context_str}
-
-Customer Query: {query}
-
-Respond with JSON containing:
-{{
-    "response": "Your professional customer-facing response",
-    "query_type": "general_inquiry | technical_support | billing_question | cancellation_refund | feature_request | account_issue",
-    "priority": "low | medium | high",
-    "requires_escalation": true/false,
-    "recommended_action": "What should be done next",
-    "internal_notes": "Notes for support team"
-}}
-
-Be professional, empathetic, and helpful. Provide actionable solutions."""
+        # Paraphrases of an earlier query with the same context reuse its answer
+        namespace = hashlib.sha1("".join(parts).encode()).hexdigest()
+        
+        parts.append("\n\nCustomer Query: ")
+        parts.append(query)
+        prompt = "".join(parts)
+        
+        # Decide hit/miss before calling Gemini: a hit must not pay for a
+        # generation, and nothing may be streamed to the caller before it
+        query_vector = await self.response_cache.embed(query)
+        if query_vector is not None:
+            cached = self.response_cache.lookup(namespace, query_vector)
+            if cached is not None:
+                logger.debug("[%s] ✓ Support response served from semantic cache", self.agent_id)
+                if on_response is not None:
+                    on_response(cached.get("response", ""))
+                return cached
+        
+        result = await self._generate_support_reply(prompt, on_response)
+        
+        if query_vector is not None:
+            self.response_cache.add(namespace, query_vector, result)
+        
+        logger.debug("[%s] ✓ Generated response (type: %s, priority: %s)",
+                     self.agent_id, result.get('query_type'), result.get('priority'))
+        
+        return result
+    
+    async def _generate_support_reply(
+        self,
+        prompt: str,
+        on_response: Optional[Callable[[str], Any]]
+    ) -> Dict[str, Any]:
+        """Call Gemini for the support reply (streamed when someone is waiting on the response text)"""
+        if on_response is not None and jiter is not None:
+            return await self._stream_support_reply(prompt, on_response)
+        
+        # Identical prompts arriving together share one Gemini call
+        result = await self._inflight.do(
+            "support:" + prompt, lambda: self._generate_json(self.support_model, prompt)
+        )
+        if on_response is not None:
+            on_response(result.get("response", ""))
+        return result
+    
+    async def _generate_json(self, model: PrefixModel, prompt: str) -> Dict[str, Any]:
+        """Single-shot Gemini call parsed as JSON"""
+        response = await model.generate_content_async(prompt)
+        _log_cache_usage(self.agent_id, response)
+        return _loads(response.text)
+    
+    async def _stream_support_reply(self, prompt: str, on_response: Callable[[str], Any]) -> Dict[str, Any]:
+        """
+        Stream the support reply, handing off "response" as soon as it is complete
         
-        # Call Gemini
-        response = self.model.generate_content(prompt)
-        response_text = response.text.strip()
-        response_text = response_text.replace('```json', '').replace('```', '').strip()
-        result = json.loads(response_text)
+        With partial_mode="on", jiter omits strings that are still being
+        written, so the field only shows up once its closing quote arrived
+        """
+        response = await self.support_model.generate_content_async(prompt, stream=True)
+        buffer = bytearray()
+        delivered = False
         
-        print(f"[{self.agent_id}] ✓ Generated response (type: {result.get('query_type')}, priority: {result.get('priority')})")
+        async for chunk in response:
+            # Safety/finish/metadata chunks can arrive without a candidate or
+            # text parts (and chunk.parts/.text raise ValueError on those)
+            if not chunk.candidates or not chunk.candidates[0].content.parts:
+                continue
+            buffer += chunk.text.encode()
+            if not delivered and b'"response"' in buffer:
+                try:
+                    partial = jiter.from_json(bytes(buffer), partial_mode="on")
+                except ValueError:
+                    continue
+                if isinstance(partial, dict) and "response" in partial:
+                    on_response(partial["response"])
+                    delivered = True
         
+        _log_cache_usage(self.agent_id, response)
+        result = _loads(bytes(buffer))
+        if not delivered:
+            on_response(result.get("response", ""))
         return result
     
     async def analyze_urgency(self, query: str) -> Dict[str, Any]:
         """
-        Analyze query urgency using Gemini
+        Analyze query urgency
+        Uses the local keyword classifier, falling back to Gemini when it
+        finds no urgency signal
         
         Args:
             query: Customer query
@@ -179,33 +424,22 @@ Be professional, empathetic, and helpful. Provide actionable solutions."""
         Returns:
             Urgency analysis
         """
-        print(f"[{self.agent_id}] Analyzing urgency with Gemini AI")
+        result = _classify_urgency(query)
+        if result is not None:
+            logger.debug("[%s] ✓ Priority: %s, Urgent: %s (local classifier)",
+                         self.agent_id, result['priority'], result['is_urgent'])
+            return result
         
-        prompt = f"""Analyze the urgency of this customer support query.
-
-Query: {query}
-
-Respond with JSON:
-{{
-    "priority": "low | medium | high",
-    "is_urgent": true/false,
-    "urgency_factors": ["factor1", "factor2"],
-    "recommended_response_time": "immediate | within 1 hour | within 24 hours | within 3 days",
-    "explanation": "Why this priority level"
-}}
-
-Consider factors like:
-- Words indicating urgency (immediately, urgent, critical, emergency)
-- Financial impact (charged twice, billing error, refund)
-- Service disruption (cannot access, not working, down)
-- Security concerns (hacked, unauthorized access)"""
+        logger.debug("[%s] Analyzing urgency with Gemini AI", self.agent_id)
+        
+        prompt = _URGENCY_TMPL.substitute(query=query)
         
-        response = self.model.generate_content(prompt)
-        response_text = response.text.strip()
-        response_text = response_text.replace('```json', '').replace('```', '').strip()
-        result = json.loads(response_text)
+        result = await self._inflight.do(
+            "urgency:" + prompt, lambda: self._generate_json(self.urgency_model, prompt)
+        )
         
-        print(f"[{self.agent_id}] ✓ Priority: {result.get('priority')}, Urgent: {result.get('is_urgent')}")
+        logger.debug("[%s] ✓ Priority: %s, Urgent: %s",
+                     self.agent_id, result.get('priority'), result.get('is_urgent'))
         
         return result
     
@@ -220,27 +454,15 @@ Consider factors like:
         Returns:
             Generated response
         """
-        print(f"[{self.agent_id}] Generating response with Gemini AI")
+        logger.debug("[%s] Generating response with Gemini AI", self.agent_id)
         
-        prompt = f"""Generate a professional customer support response.
-
-Query: {query}
-
-Context: {json.dumps(context, indent=2)}
-
-Provide a warm, professional, and helpful response. Address the customer's concerns directly and offer clear next steps if applicable.
-
-Respond with JSON:
-{{
-    "response": "Your customer-facing response"
-}}"""
+        prompt = _RESPONSE_TMPL.substitute(query=query, context=_dumps(context))
         
-        response = self.model.generate_content(prompt)
-        response_text = response.text.strip()
-        response_text = response_text.replace('```json', '').replace('```', '').strip()
-        result = json.loads(response_text)
+        response = await self.response_model.generate_content_async(prompt)
+        _log_cache_usage(self.agent_id, response)
+        result = _loads(response.text)
         
-        print(f"[{self.agent_id}] ✓ Response generated")
+        logger.debug("[%s] ✓ Response generated", self.agent_id)
         
         return result
     
@@ -261,7 +483,7 @@ Respond with JSON:
         Returns:
             Tickets data
         """
-        print(f"[{self.agent_id}] → MCP Tool: get_tickets")
+        logger.debug("[%s] → MCP Tool: get_tickets", self.agent_id)
         
         params = {"status": status, "priority": priority}
         if customer_ids:
@@ -271,9 +493,9 @@ Respond with JSON:
         
         if result.get("success"):
             count = result.get("count", 0)
-            print(f"[{self.agent_id}] ✓ Found {count} tickets")
+            logger.debug("[%s] ✓ Found %s tickets", self.agent_id, count)
         else:
-            print(f"[{self.agent_id}] ✗ {result.get('error')}")
+            logger.debug("[%s] ✗ %s", self.agent_id, result.get('error'))
         
         return result
     
@@ -281,4 +503,4 @@ Respond with JSON:
         """Disconnect from MCP server"""
         if self.mcp_client:
             await self.mcp_client.disconnect()
-            print(f"[{self.agent_id}] Disconnected from MCP server")
+            logger.debug("[%s] Disconnected from MCP server", self.agent_id)